@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Benchmark of DWF.getsig2 on the simulated AD2, previous ctypes/np.add averaging against the reused NumPy buffers,
+    and of single against record mode acquisitions. Runs without the device or the WaveForms library.
+    Author:  Jinrui Huang
+    Revision:  16-10-2026
+    Requires:  Python 3.5
+    Usage:  python -m benchmarks.bench_acquisition (from the repository root) or python benchmarks/bench_acquisition.py
+
+"""
+
+import os
+import sys
+# the repository root, for running the file directly as well as with -m
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import timeit
+import tracemalloc
+from ctypes import c_int, c_bool, c_double, byref
+import numpy as np
+from dwflib.simulator import DwfSimulator
+from dwflib.dataprocess import signal_process, results_cal
+import dwflib.DWF as DWF
+
+# a DWF set up as opendevice does, on a simulator
+def open_sim(sim):
+    dev = DWF.DWF(backend=sim)
+    sim.FDwfDeviceOpen(c_int(-1), byref(dev.h))
+    dev.scopeRange = (dev.nRange, dev.nOffset)  # no input offset to wait for
+    dev.setwave()
+    dev.setgain(dev.gain[0])
+    dev.setscope()
+    sim.FDwfAnalogInConfigure(dev.h, c_bool(False), c_bool(True))
+    return dev
+
+# getsig2 as it was before the buffers were preallocated, kept here as the reference
+def getsig2_ctypes(self, dwf, nAverage):
+    rxData1 = (c_double * self.nRecLength)()
+    arData1 = (c_double * self.nRecLength)()
+    rxData2 = (c_double * self.nRecLength)()
+    arData2 = (c_double * self.nRecLength)()
+    for iTrigger in range(nAverage):
+        while True:
+            dwf.FDwfAnalogInStatus(self.h, c_bool(True), byref(self.sts))
+            if self.sts.value == 2:
+                break
+        channel = c_int(self.nCH - 1)
+        channel2 = c_int(self.nCH)
+        dwf.FDwfAnalogInStatusData(self.h, channel, rxData1, self.nRecLength)
+        dwf.FDwfAnalogInStatusData(self.h, channel2, rxData2, self.nRecLength)
+        if iTrigger == 0:
+            arData1 = rxData1
+            arData2 = rxData2
+        else:
+            arData1 = np.add(arData1, rxData1)
+            arData2 = np.add(arData2, rxData2)
+    arData1 = np.divide(arData1, nAverage)
+    arData2 = np.divide(arData2, nAverage)
+    timevec = np.arange(0, self.nRecLength / self.nSampFreq, 1 / self.nSampFreq)
+    return timevec, arData1, np.mean(arData2)
+
+# peak traced memory in bytes and best wall time in seconds of one call
+def measure(func, nRepeat):
+    func() # warm-up, allocates the reusable buffers
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, min(timeit.repeat(func, number=1, repeat=nRepeat))
+
+def main(nAverage=400, nRepeat=5):
+    sim = DwfSimulator(seed=0)
+    dev = open_sim(sim)
+    dev.poller.tFrame = 0 # the simulator has no frame period to wait for
+    dev.nRecMaxFreq = float('inf') # nor a USB link limiting record mode
+    dev.tRecTimeout = float('inf') # and synthesizes the record slower than real time
+
+    # same frames for both versions with noise and jitter off
+    noise, jitter = sim.noise, sim.jitter
+    sim.noise, sim.jitter = 0, 0
+    _, refData, refV = getsig2_ctypes(dev, sim, nAverage)
+    _, arData, vch2 = dev.getsig2(nAverage)
+    sim.noise, sim.jitter = noise, jitter
+    print("nAverage: %d, record length: %d" % (nAverage, dev.nRecLength))
+    print("max difference: %.3e" % max(np.max(np.abs(refData-arData)), abs(refV-vch2)))
+
+    mem_old, t_old = measure(lambda: getsig2_ctypes(dev, sim, nAverage), nRepeat)
+    mem_new, t_new = measure(lambda: dev.getsig2(nAverage), nRepeat)
+    mem_rec, t_rec = measure(lambda: dev.getsig2(nAverage, 'record'), nRepeat)
+    print("ctypes + np.add:  %8.2f ms  %8.1f kB peak" % (t_old*1e3, mem_old/1024))
+    print("reused buffers:   %8.2f ms  %8.1f kB peak" % (t_new*1e3, mem_new/1024))
+    print("record mode:      %8.2f ms  %8.1f kB peak" % (t_rec*1e3, mem_rec/1024))
+    print("status calls per frame: %.2f" % dev.poller.stats()['calls_mean'])
+
+    # the processing recovers the simulated echoes
+    timevec, arData, vch2 = dev.getsig2(nAverage)
+    (protimevec, proData) = signal_process(timevec, arData, dev.Filt, dev.UpSamp, dev.nFreq)
+    toa1, toa2, peak1, peak2, vel, atten = results_cal(protimevec, proData, dev.nFreq, dev.nCycles, dev.tCutoff)
+    print("tof: %.4f us (simulated %.4f us), atten: %.2f Np/m (simulated %.2f Np/m)"
+          % ((toa2-toa1)*1e6, sim.tof*1e6, -atten, sim.atten))
+
+if __name__ == "__main__":
+    main()
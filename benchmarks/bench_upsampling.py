@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Benchmark of the FFT up-sampling in signal_process, loop-based reference against dataprocess.upsample.
+    Author:  Jinrui Huang
+    Revision:  16-10-2026
+    Requires:  Python 3.5
+    Usage:  python -m benchmarks.bench_upsampling (from the repository root) or python benchmarks/bench_upsampling.py
+
+"""
+
+import os
+import sys
+# the repository root, for running the file directly as well as with -m
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import timeit
+from ctypes import c_double
+import numpy as np
+from scipy.fft import fft, ifft
+from dwflib.dataprocess import upsample
+
+# the up-sampling as it was written in signal_process before vectorisation, kept here as the reference
+def upsample_loop(proData, nSampFreq, nUpSampFreq):
+    nRecLength = len(proData)
+    fUpSamp = nUpSampFreq/nSampFreq
+    nbin = int(fUpSamp*nRecLength)
+    upData = np.zeros((nbin,),dtype=complex)
+    fftData = fft(proData)
+    for i in range(0,int(len(fftData)/2-1)):
+        upData[i]=fftData[i]
+    for i in range(len(upData),int(len(upData)-(len(fftData)/2)),-1):
+        upData[i-1]=fftData[i-(len(upData)-len(fftData))-1]
+    upData = np.real(ifft(upData))
+    for i in range(len(upData)):
+        upData[i]=upData[i]*fUpSamp
+    uptimevec = (c_double*nbin)()
+    for i in range(len(upData)):
+        uptimevec[i]=i/nUpSampFreq
+    return uptimevec, upData
+
+def main(nSampFreq=50e6, nRecLength=8192, nRepeat=5):
+    # a 2 MHz tone-burst with noise, sampled as in DWF.getsig2
+    timevec = np.arange(0, nRecLength / nSampFreq, 1 / nSampFreq)[:nRecLength]
+    arData = np.sin(2*np.pi*2e6*timevec)*np.exp(-((timevec-20e-6)/2e-6)**2)
+    arData = arData + 0.01*np.random.default_rng(0).standard_normal(nRecLength)
+    nSampFreq = 1/(timevec[1] - timevec[0])
+
+    reftime, refData = upsample_loop(arData, nSampFreq, 1e9)
+    uptime, upData = upsample(arData, nSampFreq, 1e9)
+    err = np.max(np.abs(refData-upData))/np.max(np.abs(refData))
+    print("record length: %d, up-sampled length: %d" % (nRecLength, len(upData)))
+    print("max relative difference: %.3e, time vector identical: %s" % (err, np.array_equal(np.array(reftime), uptime)))
+
+    t_loop = min(timeit.repeat(lambda: upsample_loop(arData, nSampFreq, 1e9), number=1, repeat=nRepeat))
+    t_vec = min(timeit.repeat(lambda: upsample(arData, nSampFreq, 1e9), number=1, repeat=nRepeat))
+    print("loop:       %8.2f ms" % (t_loop*1e3))
+    print("vectorised: %8.2f ms" % (t_vec*1e3))
+    print("speed-up:   %8.1fx" % (t_loop/t_vec))
+
+if __name__ == "__main__":
+    main()
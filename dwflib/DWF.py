@@ -4,7 +4,7 @@
 	Python module for ViscoPro software, defining all API functions used for calibration/monitoring mode. 
 	Author:Jinrui Huang
 	Revision:16-01-2024
-	Requires:Python 3.5, Digilent WaveForms SDK, PicoSDK
+	Requires:Python 3.5, Digilent WaveForms SDK, PicoSDK (for temperature readings only)
  
 """
 
@@ -15,21 +15,32 @@ import numpy as np
 import os
 from dwflib.dataprocess import *
 from dwflib.dwfconstants import *
-from picolib.PicoPT104 import PT104
-from picolib.PicoTC08 import PicoTC08
-
-# load DWF library
-if sys.platform.startswith("win"):
-	dwf = cdll.dwf
-elif sys.platform.startswith("darwin"):
-	dwf = cdll.LoadLibrary("/Library/Frameworks/dwf.framework/dwf")
-else:
-	dwf = cdll.LoadLibrary("libdwf.so")
+from dwflib.polling import FramePoller
+from dwflib.waveform import toneburst
+from picolib.drivers import register
+
+# Digilent WaveForms library
+def load_dwf(module):
+	if sys.platform.startswith("win"):
+		return cdll.dwf
+	elif sys.platform.startswith("darwin"):
+		return cdll.LoadLibrary("/Library/Frameworks/dwf.framework/dwf")
+	else:
+		return cdll.LoadLibrary("libdwf.so")
+
+# DWF library, loaded on first use (see picolib.drivers), a backend can also be given to DWF, e.g. the simulator
+dwf = register('dwf', load_dwf)
 
 class DWF(object):
 
-	def __init__(self):
+	def __init__(self, backend=None):
 
+		# library the FDwf* calls go to: the dwf library by default, 'sim' or any object with the same functions
+		# (see dwflib.simulator.DwfSimulator) to run without the device
+		if backend == 'sim':
+			from dwflib.simulator import DwfSimulator
+			backend = DwfSimulator()
+		self.lib = backend if backend is not None else dwf
 		self.h = c_int()
 		self.sts = c_byte()
 
@@ -47,8 +58,11 @@ class DWF(object):
 		self.nFreq = 2e6  # transmitted wave frequency in Hz
 		self.nAmplitude = 0.5  # transmitted wave amplitude in V
 		self.nCycles = 5  # number of cycles per signal
+		self.shape = 'hann'  # tone-burst shape, 'hann', 'gauss' or 'chirp' (see dwflib.waveform.toneburst)
 		self.nSampFreq = 50e6  # sampling frequency in Hz, e.g. how many data points collected per second
 		self.nRecLength = 8192  # length of recording, e.g. how many data points to collect	
+		self.nRange = 25  # oscilloscope input range in V
+		self.nOffset = 0  # oscilloscope input offset in V
 		self.tCutoff = 1.10e-4 # starting point in the time domain to identify the reflections in the signal
 		self.tc08cn = 1 # channel to use if tc08 is used
 		self.tc08tp = 'typeT' # thermistor type for tc08
@@ -56,6 +70,7 @@ class DWF(object):
 		self.nPT = 1  # channel to use if pt104 is used
 		self.tPT = 2  # time for pt104 to convert output in seconds, increase if reads zero
 		self.typePT = 1  # 1 for PT100 and 2 for PT100 used with pt104
+		self.tTemp = 1  # time interval between background temperature readings in seconds
 		self.tPause = 60  # time interval between data collection in seconds
 		self.temp_min = 25  # minimum of temperature for calibration in degrees Celsius
 		self.temp_max = 150  # maximum of temperature for calibration in degrees Celsius
@@ -72,6 +87,24 @@ class DWF(object):
 		self.G = 26.34e9  # shear modulus of the waveguide in Pa
 		self.rhof = 850  # assumed density of the oil sample in kg/m^3
 		self.CalSample = 'S3S'  # name of calibration sample, e.g. 'S3S' for Paragon Viscosity Standard S3S
+		# acquisition buffers for oscilloscope channels 1 and 2, allocated on first use and reused across calls
+		self.rxBuf = None  # receive buffers written by the driver
+		self.acBuf = None  # accumulators for averaging
+		self.rxPtr = []  # pointers to the receive buffers passed to FDwfAnalogInStatusData
+		self.nPeriod = 0  # repeat period of the tone-burst in oscilloscope samples, set when the device is opened
+		self.acqstats = {}  # statistics of the last acquisition: mode, frames averaged, frames per second, lost/corrupted samples
+		self.poller = FramePoller(self.nRecLength / self.nSampFreq)  # waits for each frame, see poller.stats()/histogram()
+		self.scopeRange = None  # (range, offset) applied to the oscilloscope, None until set up
+		self.temps = None  # temperature logger session, opened on the first reading
+		self.sampler = None  # background temperature sampler, see starttemp
+		self.storage = 'wfa'  # backend for saved data, 'wfa', 'npy', 'hdf5' or 'csv' (see dwflib.storage)
+		self.stores = {}  # open stores by file label, kept open until closestores
+		self.writer = None  # background writer for savedata, see startwriter
+		self.nWorkers = None  # processes for signal processing in getdata, None for one per core but one, 0 for none
+		self.writerPolicy = 'block'  # when the writer queue is full, 'block' waits for space and 'drop' discards the record
+		self.nRecMaxFreq = 1e6  # highest sampling frequency in Hz (over all channels) record mode accepts, the AD2 streams the record over USB and loses most of it above about 1 MHz,
+		# too slow for the MHz tone-bursts of the measurements: record mode is for slow sampling only, getsig/getsig2 raise ValueError above it
+		self.tRecTimeout = 1  # time in seconds record mode waits for the trigger, on top of twice the length of the record
 
 	def opendevice(self):
 		# This function opens the AD2, configure the waveform generator to send a 5-cycle tone-burst at 2.0MHz frequency and 5V peak amplitude.
@@ -89,23 +122,6 @@ class DWF(object):
 		with open('GainSet.csv', 'r') as f1_read:
 			Gain = np.loadtxt(f1_read, dtype='int', delimiter=',')
 
-		# calculate the pulse length and the repeat frequency
-		nLag = int(500)
-		nPulse = int(self.nSampFreq * self.nCycles / self.nFreq)
-		nTrigger = nPulse + 2 * nLag
-		hzFreq = self.nSampFreq / nTrigger
-
-		# define vectors for data
-		Pulse = (c_double * nPulse)()
-		rgdSamples = (c_double * nTrigger)()
-
-		# define arbitrary waveform, values should be normalised to +-1
-		for i in range(0, len(Pulse)):
-			Pulse[i] = np.sin(1.0 * i / nPulse * self.nCycles * 2 * np.pi) * 0.5 * (
-					1 - np.cos(2 * np.pi * 1.0 * i / (nPulse - 1)))
-		for i in range(0, len(Pulse)):
-			rgdSamples[nLag + i] = Pulse[i]
-
 		# # display version of hardware
 		# version = create_string_buffer(16)
 		# dwf.FDwfGetVersion(version)
@@ -113,191 +129,326 @@ class DWF(object):
 
 		# discover and open device
 		print("Opening AD2...")
-		dwf.FDwfDeviceOpen(c_int(-1), byref(self.h))
+		if self.lib is dwf and not dwf.available():
+			print("Error: Failed To Open AD2! \n" + str(dwf.error))
+			return False
+		self.lib.FDwfDeviceOpen(c_int(-1), byref(self.h))
 		# # 2nd configuration for Analog Disocovery with 16k analog-in buffer
 		# dwf.FDwfDeviceConfigOpen(c_int(-1), c_int(1), byref(self.h))
 
 		if self.h.value == hdwfNone.value:
 			szError = create_string_buffer(512)
-			dwf.FDwfGetLastErrorMsg(szError)
+			self.lib.FDwfGetLastErrorMsg(szError)
 			print("Error: Failed To Open AD2! \n" + str(szError.value))
 			return False
 			# quit()
 		else:  
-			# define channels to send signal
-			channel = c_int(self.nWG - 1)  # 0 for channel 1
-			channel2 = c_int(self.nWG)  # 1 for channel 2
+			# a new device has no input range/offset applied yet
+			self.scopeRange = None
 			# configure waveform generator
-			# Awg 1 Carrier
-			dwf.FDwfAnalogOutNodeEnableSet(self.h, channel, AnalogOutNodeCarrier, c_bool(True))  # turn on AFG
-			dwf.FDwfAnalogOutNodeFunctionSet(self.h, channel, AnalogOutNodeCarrier,
-											funcCustom)  # turn on customisation of waveform
-			dwf.FDwfAnalogOutNodeDataSet(self.h, channel, AnalogOutNodeCarrier, rgdSamples,
-										c_int(nTrigger))  # load defined waveform
-			dwf.FDwfAnalogOutNodeFrequencySet(self.h, channel, AnalogOutNodeCarrier,
-											c_double(hzFreq))  # set repeating frequency
-			dwf.FDwfAnalogOutNodeAmplitudeSet(self.h, channel, AnalogOutNodeCarrier,
-											c_double(self.nAmplitude))  # set amplitude
-			dwf.FDwfAnalogOutRunSet(self.h, channel, c_double(1.0 / hzFreq))  # run for 1 period for pulse only
-			dwf.FDwfAnalogOutWaitSet(self.h, channel, c_double(
-				5 * self.nRecLength / self.nSampFreq))  # hold on till at least one recording period (This needs to be properly defined)
-			dwf.FDwfAnalogOutRepeatSet(self.h, channel, c_int())  # repeat continuously until device closed
-			dwf.FDwfDeviceTriggerSet(self.h, c_int(0),
-									trigsrcAnalogOut1)  # activate t1 when w1 is activated, 0 = T1 , 7 = trigsrcAnalogOut
-			dwf.FDwfAnalogOutConfigure(self.h, channel, c_bool(True))  # activate w1
-
-			# Awg 2 Carrier
-			dwf.FDwfAnalogOutNodeEnableSet(self.h, channel2, AnalogOutNodeCarrier, c_bool(True))  # turn on AFG	
-			dwf.FDwfAnalogOutNodeFunctionSet(self.h, channel2, AnalogOutNodeCarrier,
-											funcDC)  # turn on DC waveform
-			dwf.FDwfAnalogOutNodeAmplitudeSet(self.h, channel2, AnalogOutNodeCarrier,
-											c_double(1))  # set amplitude to 1
-			dwf.FDwfAnalogOutNodeOffsetSet(self.h, channel2, AnalogOutNodeCarrier,
-											c_double(4))  # set offset to 4 
-			dwf.FDwfAnalogOutRunSet(self.h, channel2, c_double(1.0 / hzFreq))  # run for 1 period for pulse only
-			dwf.FDwfAnalogOutRepeatSet(self.h, channel2, c_int())  # repeat continuously until device closed
-			dwf.FDwfAnalogOutConfigure(self.h, channel2, c_bool(True))  # activate w2		
+			self.setwave()
 
 			# define digital IO channels (DIO) to send triggers to set transmit/receive amplifier gain
-			# set up DIO0
-			dwf.FDwfDigitalOutCounterInitSet(self.h, c_int(0), c_int(Gain[0]),
-											c_int(Gain[0]))  # channel number, high or low represented by one or zero
-			dwf.FDwfDigitalOutEnableSet(self.h, c_int(0), c_int(1))  # channel number, integer 1 to turn on
-			# set up DIO1
-			dwf.FDwfDigitalOutCounterInitSet(self.h, c_int(1), c_int(Gain[1]), c_int(Gain[1]))  # channel number, high or low represented by one or zero
-			dwf.FDwfDigitalOutEnableSet(self.h, c_int(1), c_int(1))  # channel number, integer 1 to turn on
-			# set up DIO2
-			dwf.FDwfDigitalOutCounterInitSet(self.h, c_int(2), c_int(Gain[2]), c_int(Gain[2]))  # channel number, high or low represented by one or zero
-			dwf.FDwfDigitalOutEnableSet(self.h, c_int(2), c_int(1))  # channel number, integer 1 to turn on
-			# set up DIO3
-			dwf.FDwfDigitalOutCounterInitSet(self.h, c_int(3), c_int(Gain[3]), c_int(Gain[3]))  # channel number, high or low represented by one or zero
-			dwf.FDwfDigitalOutEnableSet(self.h, c_int(3), c_int(1))  # channel number, integer 1 to turn on
-
-			# activate DIO channels
-			dwf.FDwfDigitalOutConfigure(self.h, c_int(1))
-
-			# define oscilloscope channels to receive signal
-			channel = c_int(self.nCH - 1)  # 0 for channel 1
-			channel2 = c_int(self.nCH)  # 1 for channel 2
-			# configure oscilloscope
-			# print("Setting up acquisition and trigger...")
-			dwf.FDwfAnalogInFrequencySet(self.h, c_double(self.nSampFreq))  # acquisition sampling frequency
-			dwf.FDwfAnalogInBufferSizeSet(self.h, c_int(self.nRecLength))  # acquisition buffer size, number of points per acquisition
-			dwf.FDwfAnalogInChannelEnableSet(self.h, channel, c_bool(True))  # activate channel 1
-			dwf.FDwfAnalogInChannelRangeSet(self.h, channel,
-											c_double(25))  # acquisition amplitude range set to 20V peak to peak for channel 1
-			dwf.FDwfAnalogInChannelEnableSet(self.h, channel2, c_bool(True))  # activate channel 2
-			dwf.FDwfAnalogInChannelRangeSet(self.h, channel2,
-											c_double(25))  # acquisition amplitude range set to 20V peak to peak for channel 2
-
-			# set up trigger (location in signal to record data)
-			dwf.FDwfAnalogInTriggerAutoTimeoutSet(self.h, c_double(0))  # disable auto trigger
-			dwf.FDwfAnalogInTriggerSourceSet(self.h, trigsrcAnalogOut1)  # trigger when w1 is active
-			dwf.FDwfAnalogInTriggerTypeSet(self.h, trigtypeEdge)  # trigger type - edge
-			dwf.FDwfAnalogInTriggerConditionSet(self.h, trigcondRisingPositive)  # trigger type - rising positive edge
-			dwf.FDwfAnalogInTriggerChannelSet(self.h, channel)  # ch1 linked to trigger
-			dwf.FDwfAnalogInTriggerLevelSet(self.h, c_double(0))  # trigger level 0V
-			dwf.FDwfAnalogInTriggerHysteresisSet(self.h, c_double(0.5))  # trigger hysteresis 0.5V
-			dwf.FDwfAnalogInTriggerPositionSet(self.h, c_double(
-				(self.nRecLength - 1) / self.nSampFreq / 2))  # set trigger position to half the recording window
-
-			# wait at least 2 seconds with Analog Discovery for the offset to stabilize, before the first reading after device open or offset/range change
-			time.sleep(2)
+			self.setgain(Gain)
+
+			# configure oscilloscope (waits for the offset to stabilize)
+			self.setscope()
 
 			# start data acquisitions
 			# print("Starting repeated acquisitions...")
-			dwf.FDwfAnalogInConfigure(self.h, c_bool(False), c_bool(True))  # activate oscilloscope channels
+			self.lib.FDwfAnalogInConfigure(self.h, c_bool(False), c_bool(True))  # activate oscilloscope channels
 			print("AD2 initialsed!")
 			return True
 
+	def setwave(self):
+		# This function loads the tone-burst for the current frequency, cycles and amplitude into the waveform generator
+		# get the arbitrary waveform (cached, values normalised to +-1) and the repeat frequency
+		nLag = int(500)
+		rgdSamples = toneburst(self.nSampFreq, self.nFreq, self.nCycles, nLag, self.shape)
+		nTrigger = len(rgdSamples)
+		hzFreq = self.nSampFreq / nTrigger
+		# the pulse is repeated after run (nTrigger samples) and wait (5 record lengths) times, used to split records into frames
+		self.nPeriod = nTrigger + 5 * self.nRecLength
+		self.poller.tFrame = self.nPeriod / self.nSampFreq
+
+		# define channels to send signal
+		channel = c_int(self.nWG - 1)  # 0 for channel 1
+		channel2 = c_int(self.nWG)  # 1 for channel 2
+		# configure waveform generator
+		# Awg 1 Carrier
+		self.lib.FDwfAnalogOutNodeEnableSet(self.h, channel, AnalogOutNodeCarrier, c_bool(True))  # turn on AFG
+		self.lib.FDwfAnalogOutNodeFunctionSet(self.h, channel, AnalogOutNodeCarrier,
+										funcCustom)  # turn on customisation of waveform
+		self.lib.FDwfAnalogOutNodeDataSet(self.h, channel, AnalogOutNodeCarrier, rgdSamples.ctypes.data_as(POINTER(c_double)),
+									c_int(nTrigger))  # load defined waveform (passed without copying)
+		self.lib.FDwfAnalogOutNodeFrequencySet(self.h, channel, AnalogOutNodeCarrier,
+										c_double(hzFreq))  # set repeating frequency
+		self.lib.FDwfAnalogOutNodeAmplitudeSet(self.h, channel, AnalogOutNodeCarrier,
+										c_double(self.nAmplitude))  # set amplitude
+		self.lib.FDwfAnalogOutRunSet(self.h, channel, c_double(1.0 / hzFreq))  # run for 1 period for pulse only
+		self.lib.FDwfAnalogOutWaitSet(self.h, channel, c_double(
+			5 * self.nRecLength / self.nSampFreq))  # hold on till at least one recording period (This needs to be properly defined)
+		self.lib.FDwfAnalogOutRepeatSet(self.h, channel, c_int())  # repeat continuously until device closed
+		self.lib.FDwfDeviceTriggerSet(self.h, c_int(0),
+								trigsrcAnalogOut1)  # activate t1 when w1 is activated, 0 = T1 , 7 = trigsrcAnalogOut
+		self.lib.FDwfAnalogOutConfigure(self.h, channel, c_bool(True))  # activate w1
+
+		# Awg 2 Carrier
+		self.lib.FDwfAnalogOutNodeEnableSet(self.h, channel2, AnalogOutNodeCarrier, c_bool(True))  # turn on AFG	
+		self.lib.FDwfAnalogOutNodeFunctionSet(self.h, channel2, AnalogOutNodeCarrier,
+										funcDC)  # turn on DC waveform
+		self.lib.FDwfAnalogOutNodeAmplitudeSet(self.h, channel2, AnalogOutNodeCarrier,
+										c_double(1))  # set amplitude to 1
+		self.lib.FDwfAnalogOutNodeOffsetSet(self.h, channel2, AnalogOutNodeCarrier,
+										c_double(4))  # set offset to 4 
+		self.lib.FDwfAnalogOutRunSet(self.h, channel2, c_double(1.0 / hzFreq))  # run for 1 period for pulse only
+		self.lib.FDwfAnalogOutRepeatSet(self.h, channel2, c_int())  # repeat continuously until device closed
+		self.lib.FDwfAnalogOutConfigure(self.h, channel2, c_bool(True))  # activate w2		
+
+	def setscope(self):
+		# This function configures the oscilloscope channels and trigger
+		# define oscilloscope channels to receive signal
+		channel = c_int(self.nCH - 1)  # 0 for channel 1
+		channel2 = c_int(self.nCH)  # 1 for channel 2
+		# configure oscilloscope
+		# print("Setting up acquisition and trigger...")
+		self.lib.FDwfAnalogInFrequencySet(self.h, c_double(self.nSampFreq))  # acquisition sampling frequency
+		self.lib.FDwfAnalogInBufferSizeSet(self.h, c_int(self.nRecLength))  # acquisition buffer size, number of points per acquisition
+		self.lib.FDwfAnalogInChannelEnableSet(self.h, channel, c_bool(True))  # activate channel 1
+		self.lib.FDwfAnalogInChannelRangeSet(self.h, channel,
+										c_double(self.nRange))  # acquisition amplitude range set to 20V peak to peak for channel 1
+		self.lib.FDwfAnalogInChannelOffsetSet(self.h, channel, c_double(self.nOffset))  # acquisition offset for channel 1
+		self.lib.FDwfAnalogInChannelEnableSet(self.h, channel2, c_bool(True))  # activate channel 2
+		self.lib.FDwfAnalogInChannelRangeSet(self.h, channel2,
+										c_double(self.nRange))  # acquisition amplitude range set to 20V peak to peak for channel 2
+		self.lib.FDwfAnalogInChannelOffsetSet(self.h, channel2, c_double(self.nOffset))  # acquisition offset for channel 2
+
+		# set up trigger (location in signal to record data)
+		self.lib.FDwfAnalogInTriggerAutoTimeoutSet(self.h, c_double(0))  # disable auto trigger
+		self.lib.FDwfAnalogInTriggerSourceSet(self.h, trigsrcAnalogOut1)  # trigger when w1 is active
+		self.lib.FDwfAnalogInTriggerTypeSet(self.h, trigtypeEdge)  # trigger type - edge
+		self.lib.FDwfAnalogInTriggerConditionSet(self.h, trigcondRisingPositive)  # trigger type - rising positive edge
+		self.lib.FDwfAnalogInTriggerChannelSet(self.h, channel)  # ch1 linked to trigger
+		self.lib.FDwfAnalogInTriggerLevelSet(self.h, c_double(0))  # trigger level 0V
+		self.lib.FDwfAnalogInTriggerHysteresisSet(self.h, c_double(0.5))  # trigger hysteresis 0.5V
+		self.lib.FDwfAnalogInTriggerPositionSet(self.h, c_double(
+			(self.nRecLength - 1) / self.nSampFreq / 2))  # set trigger position to half the recording window
+
+		# wait at least 2 seconds with Analog Discovery for the offset to stabilize, before the first reading after device open or offset/range change
+		if self.scopeRange != (self.nRange, self.nOffset):
+			time.sleep(2)
+			self.scopeRange = (self.nRange, self.nOffset)
+
+	def reconfigure(self):
+		# This function applies new frequency, cycles and amplitude to the open AD2 without reopening it
+		# reload the tone-burst, run and wait times
+		self.setwave()
+		# the oscilloscope only needs to be set up again (and settle) if its range or offset changed
+		if self.scopeRange != (self.nRange, self.nOffset):
+			self.setscope()
+		# restart data acquisitions so no frame of the previous tone-burst is read
+		self.lib.FDwfAnalogInConfigure(self.h, c_bool(False), c_bool(True))
+
 	def setgain(self, Gain):
 		# define digital IO channels (DIO) to send triggers to set transmit/receive amplifier gain
 		# set up DIO0
-		dwf.FDwfDigitalOutCounterInitSet(self.h, c_int(0), c_int(Gain[0]),
+		self.lib.FDwfDigitalOutCounterInitSet(self.h, c_int(0), c_int(Gain[0]),
 										 c_int(Gain[0]))  # channel number, high or low represented by one or zero
-		dwf.FDwfDigitalOutEnableSet(self.h, c_int(0), c_int(1))  # channel number, integer 1 to turn on
+		self.lib.FDwfDigitalOutEnableSet(self.h, c_int(0), c_int(1))  # channel number, integer 1 to turn on
 		# set up DIO1
-		dwf.FDwfDigitalOutCounterInitSet(self.h, c_int(1), c_int(Gain[1]), c_int(Gain[1]))  # channel number, high or low represented by one or zero
-		dwf.FDwfDigitalOutEnableSet(self.h, c_int(1), c_int(1))  # channel number, integer 1 to turn on
+		self.lib.FDwfDigitalOutCounterInitSet(self.h, c_int(1), c_int(Gain[1]), c_int(Gain[1]))  # channel number, high or low represented by one or zero
+		self.lib.FDwfDigitalOutEnableSet(self.h, c_int(1), c_int(1))  # channel number, integer 1 to turn on
 		# set up DIO2
-		dwf.FDwfDigitalOutCounterInitSet(self.h, c_int(2), c_int(Gain[2]), c_int(Gain[2]))  # channel number, high or low represented by one or zero
-		dwf.FDwfDigitalOutEnableSet(self.h, c_int(2), c_int(1))  # channel number, integer 1 to turn on
+		self.lib.FDwfDigitalOutCounterInitSet(self.h, c_int(2), c_int(Gain[2]), c_int(Gain[2]))  # channel number, high or low represented by one or zero
+		self.lib.FDwfDigitalOutEnableSet(self.h, c_int(2), c_int(1))  # channel number, integer 1 to turn on
 		# set up DIO3
-		dwf.FDwfDigitalOutCounterInitSet(self.h, c_int(3), c_int(Gain[3]), c_int(Gain[3]))  # channel number, high or low represented by one or zero
-		dwf.FDwfDigitalOutEnableSet(self.h, c_int(3), c_int(1))  # channel number, integer 1 to turn on
+		self.lib.FDwfDigitalOutCounterInitSet(self.h, c_int(3), c_int(Gain[3]), c_int(Gain[3]))  # channel number, high or low represented by one or zero
+		self.lib.FDwfDigitalOutEnableSet(self.h, c_int(3), c_int(1))  # channel number, integer 1 to turn on
 
 		# activate DIO channels
-		dwf.FDwfDigitalOutConfigure(self.h, c_int(1))
-
-	def getsig(self, nAverage):
+		self.lib.FDwfDigitalOutConfigure(self.h, c_int(1))
+
+	def acqbuffers(self):
+		# Get the receive and accumulator buffers (one row per oscilloscope channel), only reallocated if the record length changes
+		if self.rxBuf is None or self.rxBuf.shape[1] != self.nRecLength:
+			self.rxBuf = np.zeros((2, self.nRecLength))
+			self.acBuf = np.zeros((2, self.nRecLength))
+			# the driver writes straight into the NumPy memory through these pointers
+			self.rxPtr = [self.rxBuf[i].ctypes.data_as(POINTER(c_double)) for i in range(2)]
+		return self.rxBuf, self.acBuf, self.rxPtr
+
+	def acqdone(self):
+		# Read the oscilloscope status, True once the acquisition is done
+		self.lib.FDwfAnalogInStatus(self.h, c_bool(True), byref(self.sts))
+		return self.sts.value == DwfStateDone.value
+
+	def getrecord(self, nAverage, nChannels):
+		# Capture nAverage triggered frames in one record mode acquisition and sum them into the accumulator buffers.
+		# The record starts at the trigger and frames follow every nPeriod samples, only the first nRecLength samples of each are kept.
+		# Frames hit by lost or corrupted samples are left out, returns the number of frames summed.
+		# Note the device streams every sample of the record over USB, at high sampling frequencies samples will be lost (see nRecMaxFreq).
+		# Gives up when the record is not complete tRecTimeout seconds after twice its length, returning the frames summed so far.
+		arData = self.acqbuffers()[1]
+		arData.fill(0)
+		nTotal = nAverage * self.nPeriod
+		frame = np.zeros((nChannels, self.nPeriod))
+		cAvailable = c_int()
+		cLost = c_int()
+		cCorrupted = c_int()
+		nLost = 0
+		nCorrupted = 0
+		nFrames = 0
+		nDone = 0  # samples of the record received (or lost) so far
+		bBad = False  # whether the current frame has missing or corrupted samples
+		tic = time.perf_counter()
+		tDeadline = tic + 2 * nTotal / self.nSampFreq + self.tRecTimeout
+		bTimeout = False
+
+		# switch the oscilloscope to record mode, starting at the trigger
+		self.lib.FDwfAnalogInAcquisitionModeSet(self.h, acqmodeRecord)
+		self.lib.FDwfAnalogInRecordLengthSet(self.h, c_double(nTotal / self.nSampFreq))
+		self.lib.FDwfAnalogInTriggerPositionSet(self.h, c_double(0))
+		self.lib.FDwfAnalogInConfigure(self.h, c_bool(False), c_bool(True))
+		try:
+			while nDone < nTotal:
+				if time.perf_counter() > tDeadline:
+					# no trigger, or the device stopped sending the record
+					print("Record mode timed out with %d of %d samples received" % (nDone, nTotal))
+					bTimeout = True
+					break
+				self.lib.FDwfAnalogInStatus(self.h, c_bool(True), byref(self.sts))
+				if nDone == 0 and self.sts.value in (DwfStateConfig.value, DwfStatePrefill.value, DwfStateArmed.value):
+					# acquisition not yet started
+					time.sleep(0.001)
+					continue
+				self.lib.FDwfAnalogInStatusRecord(self.h, byref(cAvailable), byref(cLost), byref(cCorrupted))
+				nLost += cLost.value
+				nCorrupted += cCorrupted.value
+				if cLost.value:
+					# skip over the lost samples, frames the gap runs through are never completed
+					nDone = min(nDone + cLost.value, nTotal)
+					# and the frame it ends in is incomplete, unless it ends on a frame boundary
+					bBad = nDone % self.nPeriod != 0
+				# corrupted samples cannot be located in the data, drop every frame this read touches
+				bCorrupted = cCorrupted.value > 0
+				bBad = bBad or bCorrupted
+				if cAvailable.value == 0:
+					# nothing new yet
+					time.sleep(0.001)
+					continue
+				iData = 0
+				nAvailable = min(cAvailable.value, nTotal - nDone)
+				# split the available samples at frame boundaries
+				while nAvailable > 0:
+					iOffset = nDone % self.nPeriod
+					n = min(nAvailable, self.nPeriod - iOffset)
+					for i in range(nChannels):
+						self.lib.FDwfAnalogInStatusData2(self.h, c_int(self.nCH - 1 + i), frame[i, iOffset:].ctypes.data_as(POINTER(c_double)),
+													c_int(iData), c_int(n))
+					iData += n
+					nAvailable -= n
+					nDone += n
+					if nDone % self.nPeriod == 0:
+						# frame complete
+						if not bBad:
+							arData[:nChannels] += frame[:, :self.nRecLength]
+							nFrames += 1
+						bBad = bCorrupted
+		finally:
+			# back to single acquisitions as configured in opendevice
+			self.lib.FDwfAnalogInAcquisitionModeSet(self.h, acqmodeSingle)
+			self.lib.FDwfAnalogInBufferSizeSet(self.h, c_int(self.nRecLength))
+			self.lib.FDwfAnalogInTriggerPositionSet(self.h, c_double((self.nRecLength - 1) / self.nSampFreq / 2))
+			self.lib.FDwfAnalogInConfigure(self.h, c_bool(False), c_bool(True))
+
+		toc = time.perf_counter()
+		self.acqstats = {'mode': 'record', 'frames': nFrames, 'fps': nFrames / (toc - tic),
+						'lost': nLost, 'corrupted': nCorrupted, 'timeout': bTimeout}
+		return nFrames
+
+	def recordframes(self, nAverage, nChannels):
+		# record mode acquisition for getsig/getsig2, returns the number of frames summed, 0 to use single acquisitions instead
+		# refused above nRecMaxFreq, where most of the record would be lost
+		if self.nSampFreq * nChannels > self.nRecMaxFreq:
+			raise ValueError("Record mode needs a sampling frequency of at most %g Hz over %d channel(s), not %g Hz: use mode 'single'"
+							% (self.nRecMaxFreq, nChannels, self.nSampFreq * nChannels))
+		nFrames = self.getrecord(nAverage, nChannels)
+		if nFrames == 0:
+			print("Record mode lost all frames, using single acquisitions...")
+		elif nFrames < nAverage / 2:
+			print("Record mode averaged only %d of %d frames (%d samples lost)" % (nFrames, nAverage, self.acqstats['lost']))
+		return nFrames
+
+	def getsig(self, nAverage, mode='single'):
 		# To get a signal with n number of acquisition (100 by default), higher nAverage for better SNR but will slow down measurements
+		# mode 'single' reads one triggered buffer per average, 'record' captures all of them in one record acquisition (see getrecord,
+		# only up to nRecMaxFreq, ValueError above it)
+		if mode == 'record':
+			nFrames = self.recordframes(nAverage, 1)
+			if nFrames > 0:
+				arData = np.divide(self.acBuf[0], nFrames)
+				timevec = np.arange(0, self.nRecLength / self.nSampFreq, 1 / self.nSampFreq)
+				return timevec, arData
 		# define vectors for data
-		rxData = (c_double * self.nRecLength)()
-		arData = (c_double * self.nRecLength)()
-		timevec = (c_double * self.nRecLength)()
+		rxData, arData, rxPtr = self.acqbuffers()
+		arData[0].fill(0)
+		# define channel to receive data
+		channel = c_int(self.nCH - 1)
+		tic = time.perf_counter()
+		self.poller.start()
 
 		# print("Collecting signal...")
 		for iTrigger in range(nAverage):
 			# new acquisition is started automatically after done state
-			while True:
-				dwf.FDwfAnalogInStatus(self.h, c_bool(True), byref(self.sts))
-				# print(self.sts.value)
-				# print(DwfStateDone.value)
-				if self.sts.value == DwfStateDone.value:
-					break
-				time.sleep(0.001)
-			# define channel to receive data
-			channel = c_int(self.nCH - 1)
+			self.poller.wait(self.acqdone)
 			# pass data to vector
-			dwf.FDwfAnalogInStatusData(self.h, channel, rxData, self.nRecLength)  # get channel 1 data
+			self.lib.FDwfAnalogInStatusData(self.h, channel, rxPtr[0], c_int(self.nRecLength))  # get channel 1 data
 			# overlapping data
-			if iTrigger == 0:
-				arData = rxData
-			else:
-				arData = np.add(arData, rxData)
-		# averaging data
-		arData = np.divide(arData, nAverage)
+			arData[0] += rxData[0]
+		self.acqstats = {'mode': 'single', 'frames': nAverage, 'fps': nAverage / (time.perf_counter() - tic),
+						'lost': 0, 'corrupted': 0}
+		# averaging data (into a new array, the buffers are reused by the next call)
+		arData = np.divide(arData[0], nAverage)
 		# get time vector
 		timevec = np.arange(0, self.nRecLength / self.nSampFreq, 1 / self.nSampFreq)
 
 		return timevec, arData
 	
-	def getsig2(self, nAverage):
+	def getsig2(self, nAverage, mode='single'):
 		# To get a signal with n number of acquisition (100 by default), higher nAverage for better SNR but will slow down measurements
 		# Including channel 2 for voltage reading from pt1000
+		# mode 'single' reads one triggered buffer per average, 'record' captures all of them in one record acquisition (see getrecord,
+		# only up to nRecMaxFreq, ValueError above it)
+		if mode == 'record':
+			nFrames = self.recordframes(nAverage, 2)
+			if nFrames > 0:
+				arData1 = np.divide(self.acBuf[0], nFrames)
+				arData2 = np.divide(self.acBuf[1], nFrames)
+				timevec = np.arange(0, self.nRecLength / self.nSampFreq, 1 / self.nSampFreq)
+				return timevec, arData1, np.mean(arData2)
 		# define vectors for data
-		rxData1 = (c_double * self.nRecLength)()
-		arData1 = (c_double * self.nRecLength)()
-		rxData2 = (c_double * self.nRecLength)()
-		arData2 = (c_double * self.nRecLength)()		
-		timevec = (c_double * self.nRecLength)()
+		rxData, arData, rxPtr = self.acqbuffers()
+		arData.fill(0)
+		# define channel to receive data
+		channel = c_int(self.nCH - 1)
+		channel2 = c_int(self.nCH)
+		tic = time.perf_counter()
+		self.poller.start()
 
 		# print("Collecting signal...")
 		for iTrigger in range(nAverage):
 			# new acquisition is started automatically after done state
-			while True:
-				dwf.FDwfAnalogInStatus(self.h, c_bool(True), byref(self.sts))
-				# print(self.sts.value)
-				# print(DwfStateDone.value)
-				if self.sts.value == DwfStateDone.value:
-					break
-				time.sleep(0.001)
-			# define channel to receive data
-			channel = c_int(self.nCH - 1)
-			channel2 = c_int(self.nCH)
+			self.poller.wait(self.acqdone)
 			# pass data to vector
-			dwf.FDwfAnalogInStatusData(self.h, channel, rxData1, self.nRecLength)  # get channel 1 data
-			dwf.FDwfAnalogInStatusData(self.h, channel2, rxData2, self.nRecLength)  # get channel 2 data
+			self.lib.FDwfAnalogInStatusData(self.h, channel, rxPtr[0], c_int(self.nRecLength))  # get channel 1 data
+			self.lib.FDwfAnalogInStatusData(self.h, channel2, rxPtr[1], c_int(self.nRecLength))  # get channel 2 data
 			# overlapping data
-			if iTrigger == 0:
-				arData1 = rxData1
-				arData2 = rxData2
-			else:
-				arData1 = np.add(arData1, rxData1)
-				arData2 = np.add(arData2, rxData2)
-		# averaging data
-		arData1 = np.divide(arData1, nAverage)
-		arData2 = np.divide(arData2, nAverage)
+			arData += rxData
+		self.acqstats = {'mode': 'single', 'frames': nAverage, 'fps': nAverage / (time.perf_counter() - tic),
+						'lost': 0, 'corrupted': 0}
+		# averaging data (into new arrays, the buffers are reused by the next call)
+		arData1 = np.divide(arData[0], nAverage)
+		arData2 = np.divide(arData[1], nAverage)
 		# get time vector
 		timevec = np.arange(0, self.nRecLength / self.nSampFreq, 1 / self.nSampFreq)
 
@@ -334,34 +485,80 @@ class DWF(object):
 
 	# 	return temp
 	
-	def gettemp(self):
-		# Set up temperature logger and get temperature from channel specified
-		# initialise and open PT104
-		temp = 0
-		temp_pt104 = 0
-		temp_tc08 = 0
-		try: 
-			pt104 = PT104()
-			pt104.openunit(self.PicoSN)
-			pt104.setmain()
-			# print("nPT: %d, typePT: %d, tPT: %d" % (self.nPT, self.typePT, self.tPT))
-			pt104.setchannel(self.nPT, self.typePT, 4, self.tPT)
-			temp_pt104 = pt104.getvalue(self.nPT)
-			pt104.closeunit()
-			if not temp_pt104 == 0:
-				temp = temp_pt104
-			else: 
-				tc08 = PicoTC08()
-				tc08.openunit(self.tc08cn,self.tc08tp)
-				temp_tc08 = tc08.getvalue(self.tc08cn)
-				tc08.closeunit()
-				if not temp_tc08 == 0:
-					temp = temp_tc08
-		except Exception as e:
-			pass
-		
-		return temp
-
+	def opentemp(self):
+		# Open the temperature logger session on first use, the Pico modules are only imported then
+		if self.temps is None:
+			from picolib.PicoTemp import TempSession
+			self.temps = TempSession(self.PicoSN, self.nPT, self.typePT, self.tPT, self.tc08cn, self.tc08tp)
+		return self.temps
+
+	def gettemp(self, maxage=0):
+		# Get temperature from the PT104, or from the TC08 if the PT104 reads zero, 0 if no logger is available
+		# the loggers are opened on the first call and stay open, a reading younger than maxage seconds is reused
+		self.opentemp()
+		return self.temps.get(maxage)
+
+	def starttemp(self):
+		# Start reading the temperature in the background every tTemp seconds, waits (up to a few seconds) for the first
+		# reading to be attempted, without a logger attached that returns at once and gettempat gives 0
+		self.opentemp()
+		if self.sampler is None:
+			from picolib.PicoTemp import TempSampler
+			self.sampler = TempSampler(self.temps, self.tTemp)
+		self.sampler.start()
+		self.sampler.tried.wait(self.tPT + 5 * self.tTemp)
+
+	def gettempat(self, t):
+		# Get the temperature at time t (from time.monotonic()) interpolated from the background readings
+		# without a running sampler a new reading is taken instead
+		if self.sampler is None or not self.sampler.running():
+			return self.gettemp()
+		return self.sampler.at(t)
+
+	def closetemp(self):
+		# This function stops the background readings and closes the temperature loggers
+		if self.sampler is not None:
+			self.sampler.stop()
+		if self.temps is not None:
+			self.temps.close()
+
+
+	def startwriter(self):
+		# Start a background writer, savedata then queues the records instead of writing them itself
+		if self.writer is None:
+			from dwflib.storage import StoreWriter
+			self.writer = StoreWriter(self.storage, policy=self.writerPolicy)
+		self.writer.start()
+
+	def savedata(self, label, data, signal, info=None):
+		# Save the results of one record (in the order of storage.DATA_COLUMNS) and its signal to the store for label
+		# with a writer running the record is queued, otherwise it is written and flushed here
+		# the store is opened on the first record, with the acquisition settings in info, and kept open until closestores
+		if self.writer is not None and self.writer.running():
+			return self.writer.put(label, data, signal, info)
+		if label not in self.stores:
+			from dwflib.storage import openstore
+			self.stores[label] = openstore(label, self.storage, info=info)
+		self.stores[label].append(data, signal)
+		self.stores[label].flush()
+		return True
+
+	def closestores(self):
+		# Write the records still queued and close the stores opened by savedata
+		if self.writer is not None:
+			self.writer.stop()
+			stats = self.writer.stats()
+			print("Records saved: %d, dropped: %d, max queue depth: %d, blocked: %.3f s" % (stats['written'], stats['dropped'], stats['depth_max'], stats['blocked']))
+			self.writer = None
+		for store in self.stores.values():
+			store.close()
+		self.stores = {}
+
+	def saveresults(self, done):
+		# Save and print the results returned by the processing engine in getdata
+		for (label, info, temp, vch2, rhof, visc, arData), (toa1, toa2, peak1, peak2, vel, atten) in done:
+			self.savedata(label, [temp,toa1,toa2,peak1,peak2,vch2,atten,rhof,visc], arData, info)
+			self.printRow(temp, vch2, atten)
 
 	def printSerialHeader(self):
 		# Print data header
@@ -407,71 +604,80 @@ class DWF(object):
 			toa1 = c_double()	
 			toa2 = c_double()	
 
-			self.printSerialHeader()
-			count = 0
-
-			# loop data collection until conditions are met
-			# collect data with multiple frequency, voltage and gain settings as defined
-			while True:
-				count += 1
-				for j in range(len(self.freq)):
-					for i in range(len(self.volt)): 
-						self.nFreq = self.freq[j]
-						self.nAmplitude = self.volt[i]
-						self.closedevice()
-						self.opendevice()
-						for k in range(len(self.gain)):
-							self.setgain(self.gain[k])
-
-							# get temperature pre-data collection
-							temp = self.gettemp()
-
-							# collect data
-							[timevec, arData, vch2] = self.getsig2(nAverage)
-
-							# get temperature post-data collection and average
-							temp1 = self.gettemp()				
-							temp = (temp + temp1) / 2
-
-							# get density and viscosity data if sample known
-							(rhof,visc) = rhofvu(temp,sample)
-
-							# data processing (butterworth filter and up-sampling)
-							(protimevec, proData) = signal_process(timevec, arData, self.Filt, self.UpSamp, self.nFreq)
-
-							# calculation for acoustic properties (velocity of sound and attenuation of sound)
-							toa1, toa2, peak1, peak2, vel, atten = results_cal(protimevec, proData, self.nFreq, self.nCycles, self.tCutoff)
-
-							# save signal and data collected, label with sample name, frequency, voltage and gain settings. 
-							# print("Saving data...")
-							with open('Data_'+sample+'_'+str(self.nAmplitude)+'v_'+str(self.nFreq)+'hz_'+str(self.gain[k])+'.csv', 'a') as f2_append:
-								# np.savetxt(f2_append, np.c_[temp, vch2, atten], fmt=('%.18e,%.18e,%.18e'), delimiter=',')
-								np.savetxt(f2_append, np.c_[temp,toa1,toa2,peak1,peak2,vch2,atten,rhof,visc], fmt=('%.18e,%.18e,%.18e,%.18e,%.18e,%.18e,%.18e,%.18e,%.18e'), delimiter=',')
-							with open('Signal_'+sample+'_'+str(self.nAmplitude)+'v_'+str(self.nFreq)+'hz_'+str(self.gain[k])+'.csv','a') as f1_append:
-								np.savetxt(f1_append,[arData],delimiter = ',')
-
-							# print results in terminal
-							self.printRow(temp, vch2, atten)
-
-				# define break condition if temperature sweep (e.g. temperature drops to below min of range)
-				if temp < self.temp_min and bSweep == True:
-					print("Data collection complete!")
-					break
-
-				# pause between data collection (wait for temperature to change) if temperature sweep
-				if bSweep == True:
-					time.sleep(self.tPause)
-
-				# collect 30 signal if no temperature sweep
-				if count == 30 and bSweep == False: 
-					print("Data collection complete!")
-					break
+			# read the temperature and save the data in the background during data collection
+			self.starttemp()
+			self.startwriter()
+			from dwflib.engine import ProcessEngine
+			engine = ProcessEngine(self.nWorkers, self.nRecLength)
+
+			# the temperature session, stores and engine are closed however the collection ends
+			try:
+				self.printSerialHeader()
+				count = 0
+
+				# loop data collection until conditions are met
+				# collect data with multiple frequency, voltage and gain settings as defined
+				while True:
+					count += 1
+					for j in range(len(self.freq)):
+						for i in range(len(self.volt)): 
+							self.nFreq = self.freq[j]
+							self.nAmplitude = self.volt[i]
+							# open the AD2 on the first pass, afterwards only the tone-burst is reloaded
+							if self.h.value == hdwfNone.value:
+								self.opendevice()
+							else:
+								self.reconfigure()
+							for k in range(len(self.gain)):
+								self.setgain(self.gain[k])
+
+								# collect data, noting start and end times
+								tStart = time.monotonic()
+								[timevec, arData, vch2] = self.getsig2(nAverage)
+								tEnd = time.monotonic()
+
+								# get temperature at the start and end of data collection (from the background readings) and average
+								temp = (self.gettempat(tStart) + self.gettempat(tEnd)) / 2
+
+								# get density and viscosity data if sample known
+								(rhof,visc) = rhofvu(temp,sample)
+
+								# data processing (butterworth filter and up-sampling) and calculation for acoustic properties in the engine,
+								# the signals are processed while the next ones are collected and the results saved as they come back
+								# label with sample name, frequency, voltage and gain settings
+								label = sample+'_'+str(self.nAmplitude)+'v_'+str(self.nFreq)+'hz_'+str(self.gain[k])
+								info = {'nSampFreq': self.nSampFreq, 'nFreq': self.nFreq, 'nAmplitude': self.nAmplitude, 'gain': self.gain[k],
+										'Filt': self.Filt, 'UpSamp': self.UpSamp, 'nCycles': self.nCycles, 'tCutoff': self.tCutoff}
+								engine.submit((label, info, temp, vch2, rhof, visc, arData), timevec, arData, self.Filt, self.UpSamp, self.nFreq, self.nCycles, self.tCutoff)
+								self.saveresults(engine.ready())
+
+					# save the results of this pass still being processed
+					self.saveresults(engine.drain())
+
+					# define break condition if temperature sweep (e.g. temperature drops to below min of range)
+					if temp < self.temp_min and bSweep == True:
+						print("Data collection complete!")
+						break
+
+					# pause between data collection (wait for temperature to change) if temperature sweep
+					if bSweep == True:
+						time.sleep(self.tPause)
+
+					# collect 30 signal if no temperature sweep
+					if count == 30 and bSweep == False: 
+						print("Data collection complete!")
+						break
+			finally:
+				self.closetemp()
+				self.closestores()
+				engine.close()
 
 	def closedevice(self):
 		# This functions closes the AD2
 		# define channel to close
 		channel = c_int(self.nWG - 1)  # input = channel number -1
 		# disconnect device and close it
-		dwf.FDwfAnalogOutConfigure(self.h, channel, c_bool(False))
-		dwf.FDwfDeviceCloseAll()
+		self.lib.FDwfAnalogOutConfigure(self.h, channel, c_bool(False))
+		self.lib.FDwfDeviceCloseAll()
+		self.h.value = hdwfNone.value
 		print('AD2 closed!')
@@ -8,11 +8,13 @@
    
 """
 
-from scipy.signal import find_peaks, butter, lfilter
-from scipy.fft import fft, ifft #library structure varies for different versions (fft, ifft are either from scipy.fft or scipy)
+from scipy.signal import find_peaks, butter, lfilter, sosfilt, sosfiltfilt
+from scipy.fft import fft, ifft, rfft, irfft #library structure varies for different versions (fft, ifft are either from scipy.fft or scipy)
 from ctypes import *
 import numpy as np
 import os
+import csv
+from functools import lru_cache
 
 # to get the coefficients for Butterworth filter
 def butter_bandpass(lowcut, highcut, fs, order): 
@@ -23,27 +25,89 @@ def butter_bandpass(lowcut, highcut, fs, order):
     b, a = butter(order, [low, high], btype='band')
     return b, a
     
-# to get the coefficients for the filter and then apply filter to data set
-def butter_bandpass_filter(data, lowcut, highcut, fs, order):
-    b, a = butter_bandpass(lowcut, highcut, fs, order)
-    y = lfilter(b, a, data)
+# to get the filter as second-order sections, designs are cached as only a few (band, fs, order) combinations are used
+@lru_cache(maxsize=32)
+def butter_bandpass_sos(lowcut, highcut, fs, order):
+    nyq = 0.5 * fs
+    low = lowcut / nyq
+    high = highcut / nyq
+    # the same array is handed to every caller, so it must not be modified
+    sos = butter(order, [low, high], btype='band', output='sos')
+    return sos
+
+# to get the coefficients for the filter and then apply filter to data set (along the last axis)
+# set zerophase True for forward-backward filtering, which removes the phase delay but squares the magnitude response
+def butter_bandpass_filter(data, lowcut, highcut, fs, order, zerophase=False):
+    sos = butter_bandpass_sos(float(lowcut), float(highcut), float(fs), int(order))
+    if zerophase:
+        y = sosfiltfilt(sos, data, axis=-1)
+    else:
+        y = sosfilt(sos, data, axis=-1)
     return y
     
+# to get a function returning the index of the element closest to a target (first one if several are equally close)
+# the array is checked once: uniformly spaced vectors are indexed arithmetically, sorted ones with a binary search
+# and anything else falls back to a full scan, so repeated lookups on the same time vector are cheap
+def index_finder(data):
+    arData = np.asarray(data, dtype=float) # also takes ctypes arrays without copying
+    nLength = len(arData)
+    delta = np.diff(arData)
+    if nLength > 1 and np.all(delta > 0):
+        dt = (arData[-1]-arData[0])/(nLength-1)
+        if np.allclose(delta, dt, rtol=1e-9, atol=0):
+            def guess(value):
+                return int(np.ceil((value-arData[0])/dt-0.5))
+        else:
+            def guess(value):
+                return int(np.searchsorted(arData, value))
+        def find_sorted(value):
+            # the guess is at most one element away from the closest one, check its neighbours
+            index = min(max(guess(value), 0), nLength-1)
+            for i in (index-1, index+1):
+                if 0 <= i < nLength and (abs(arData[i]-value) < abs(arData[index]-value) or
+                                         (i < index and abs(arData[i]-value) == abs(arData[index]-value))):
+                    index = i
+            return index
+        return find_sorted
+    def find_any(value):
+        return int(np.argmin(np.abs(arData-value)))
+    return find_any
+
 # to find the index of an element in an array that has the closest value to a target
 def find(data,value):
-    delta = np.zeros(len(data))
-    for i in range(len(data)):
-        delta[i] = abs(data[i]-value)
-    index = np.nonzero(delta==min(delta))
-    return index[0][0]
+    return index_finder(data)(value)
     
+# to up-sample a signal by zero-padding its spectrum, works along the last axis so a stack of records can be passed at once
+def upsample(data, nSampFreq, nUpSampFreq):
+    proData = np.asarray(data, dtype=float)
+    nRecLength = proData.shape[-1]
+    fUpSamp = nUpSampFreq/nSampFreq
+    nbin = int(fUpSamp*nRecLength)
+    # bins kept from the original spectrum: positive frequencies below nPos and negative frequencies down to -nNeg
+    # (the Nyquist bin of the original record is taken from the negative half)
+    nPos = int(nRecLength/2-1)
+    nNeg = nbin-int(nbin-nRecLength/2)
+    fftData = rfft(proData, axis=-1)
+    if nNeg >= fftData.shape[-1]:
+        # odd record length, the highest negative bin is the mirror of a positive one
+        fftData = np.concatenate((fftData, np.conj(fftData[..., nRecLength-np.arange(fftData.shape[-1], nNeg+1)])), axis=-1)
+    # a bin present on one side only keeps half of its amplitude once the real part is taken, hence the 0.5 weight
+    upData = np.zeros(proData.shape[:-1]+(nbin//2+1,), dtype=complex)
+    upData[..., :nPos] = fftData[..., :nPos]
+    upData[..., :nNeg+1] += fftData[..., :nNeg+1]
+    upData *= 0.5
+    upData = irfft(upData, n=nbin, axis=-1)
+    upData *= fUpSamp
+    # get time vector
+    uptimevec = np.arange(nbin)/nUpSampFreq
+    return uptimevec, upData
+
 def signal_process(timevec, arData, Filter, UpSampling, nFreq): 
     # passing data vector
     proData = arData
     protimevec = timevec
-    # from data get sampling frequency and data length
+    # from data get sampling frequency
     nSampFreq = 1/(protimevec[1] - protimevec[0])
-    nRecLength = len(proData)
     
     # apply filter if set true
     if Filter == True:
@@ -55,24 +119,7 @@ def signal_process(timevec, arData, Filter, UpSampling, nFreq):
     # apply upsampling if set true
     if UpSampling == True:
         ## up-sample to 1GHz (1e9 samples per second)
-        nUpSampFreq = 1e9
-        fUpSamp = nUpSampFreq/nSampFreq
-        nbin = int(fUpSamp*nRecLength)
-        upData = np.zeros((nbin,),dtype=complex)
-        fftData = fft(proData)
-        for i in range(0,int(len(fftData)/2-1)):
-            upData[i]=fftData[i]
-        for i in range(len(upData),int(len(upData)-(len(fftData)/2)),-1):
-            upData[i-1]=fftData[i-(len(upData)-len(fftData))-1]
-        upData = np.real(ifft(upData))
-        for i in range(len(upData)):
-            upData[i]=upData[i]*fUpSamp
-        uptimevec = (c_double*nbin)()
-        # get time vector
-        for i in range(len(upData)):
-            uptimevec[i]=i/nUpSampFreq
-        protimevec = uptimevec
-        proData = upData
+        (protimevec, proData) = upsample(proData, nSampFreq, 1e9)
     
     return protimevec, proData
 
@@ -83,11 +130,10 @@ def results_cal(protimevec,proData,nFreq,nCycles,timecutoff):
     
     # identify the 1st reflection
     nSampFreq = 1/(protimevec[1]-protimevec[0])
-    indexcutoff = find(protimevec,timecutoff)
+    find_index = index_finder(protimevec)
+    indexcutoff = find_index(timecutoff)
     indexpeaks,_ = find_peaks(proData[indexcutoff:len(proData)],height = fac_thd*max(proData[indexcutoff:]),distance = 3*nSampFreq*nCycles/nFreq)
-    indexPeaks = np.zeros(len(indexpeaks),dtype=int)
-    for i in range(0,len(indexpeaks)):
-        indexPeaks[i] = indexpeaks[i]+indexcutoff
+    indexPeaks = indexpeaks+indexcutoff
         
     # get the time of arrival for the 1st reflection and index with interpolation
     dT = protimevec[indexPeaks[0]]-protimevec[indexPeaks[0]-1]
@@ -100,12 +146,10 @@ def results_cal(protimevec,proData,nFreq,nCycles,timecutoff):
 
     # identify the 2nd reflection
     timecutoff2 = protimevec[indexPeak1]+8e-6
-    indexcutoff = find(protimevec,timecutoff2)
-    indexend = find(protimevec,timecutoff2+3e-6)
+    indexcutoff = find_index(timecutoff2)
+    indexend = find_index(timecutoff2+3e-6)
     indexpeaks,_ = find_peaks(proData[indexcutoff:indexend],height = fac_thd*max(proData[indexcutoff:indexend]),distance = 3*nSampFreq*nCycles/nFreq)
-    indexPeaks = np.zeros(len(indexpeaks),dtype=int)
-    for i in range(0,len(indexpeaks)):
-        indexPeaks[i] = indexpeaks[i]+indexcutoff
+    indexPeaks = indexpeaks+indexcutoff
 
     # get the time of arrival for the 2nd reflection and index with interpolation
     m1 = (proData[indexPeaks[0]]-proData[indexPeaks[0]-1])/dT
@@ -125,74 +169,121 @@ def results_cal(protimevec,proData,nFreq,nCycles,timecutoff):
        
     return Int_T1, Int_T2, Peak1, Peak2, vel, atten
 
-# get density and viscosity of known samples depending on temperature
-def rhofvu(temperature,type_sample):
+# get the time of arrival of peaks by parabolic interpolation, for a stack of signals with one peak index per record
+def peak_interp(protimevec, proData, indexPeak, dT):
+    rows = np.arange(proData.shape[0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m1 = (proData[rows,indexPeak]-proData[rows,indexPeak-1])/dT
+        m2 = (proData[rows,indexPeak+1]-proData[rows,indexPeak])/dT
+        M = (m2-m1)/(2*dT)
+        dT3= -1*m1/M
+    return dT3+protimevec[indexPeak-1]
 
-    vu = 0
-    rhof = 0
+# to find the first peak in a window as results_cal does, -1 if there is none
+def first_peak(window, height, distance):
+    indexpeaks,_ = find_peaks(window,height = height,distance = distance)
+    if len(indexpeaks) == 0:
+        return -1
+    return indexpeaks[0]
 
-    if type_sample == 'S600':
-        p_rhof = [-0.000590440403569401,0.858310527135024]
-        rhof = p_rhof[0]*temperature + p_rhof[1] #in g/cm3   
-        p_nu = [8.09628403884733,7.40047695400422,-0.0624543915524598,0.000175851462028443]
-        nu = np.exp(p_nu[0])*np.exp(p_nu[1]/temperature+p_nu[2]*temperature+p_nu[3]*temperature**2) #in mPa s
-        vu = nu/rhof #in cSt    
-        rhof = rhof*1e3 #in kg/m3
-    
-    if type_sample == 'S60':
-        p_rhof = [-0.000636193475467889,0.888793688383073];
-        rhof = p_rhof[0]*temperature + p_rhof[1] #in g/cm3   
-        p_nu = [6.09426031336495,1.93903872633985,-0.0669305189350423,0.000240395048492693]
-        nu = np.exp(p_nu[0])*np.exp(p_nu[1]/temperature+p_nu[2]*temperature+p_nu[3]*temperature**2) #in mPa s
-        vu = nu/rhof #in cSt    
-        rhof = rhof*1e3 #in kg/m3
-    
-    if type_sample == 'N350':
-        p_rhof = [-0.000589193302640659,0.885119170795794]
-        rhof = p_rhof[0]*temperature + p_rhof[1] #in g/cm3  
-        p_nu = [7.77453937809582,8.95539541920474,-0.0688531041991786,0.000208226882730463]
-        nu = np.exp(p_nu[0])*np.exp(p_nu[1]/temperature+p_nu[2]*temperature+p_nu[3]*temperature**2) #in mPa s
-        vu = nu/rhof #in cSt    
-        rhof = rhof*1e3 #in kg/m3
-    
-    if type_sample == 'N35':
-        p_rhof = [-0.000625639760998825,0.869224566278919];
-        rhof = p_rhof[0]*temperature + p_rhof[1] #in g/cm3  
-        p_nu = [4.78514868686062,8.02834694098624,-0.0479235880493548,0.000142520951173293]
-        nu = np.exp(p_nu[0])*np.exp(p_nu[1]/temperature+p_nu[2]*temperature+p_nu[3]*temperature**2) #in mPa s
-        vu = nu/rhof #in cSt    
-        rhof = rhof*1e3 #in kg/m3
-    
-    if type_sample == 'S3S':
-        p_rhof = [-0.000699195896992767,0.834173694916320]
-        rhof = p_rhof[0]*temperature + p_rhof[1] #in g/cm3  
-        p_nu = [1.51274855245423,3.92003348585739,-0.0211267393546965,4.44591968497190e-05]
-        nu = np.exp(p_nu[0])*np.exp(p_nu[1]/temperature+p_nu[2]*temperature+p_nu[3]*temperature**2) #in mPa s
-        vu = nu/rhof #in cSt    
-        rhof = rhof*1e3 #in kg/m3
-
-    if type_sample == 'S6S':
-        p_rhof = [-0.000672928619079388,0.858228485657105]
-        rhof = p_rhof[0]*temperature + p_rhof[1] #in g/cm3  
-        p_nu = [2.33742852670512,6.95924738065282,-0.0262433861993490,5.92404527473303e-05]
-        nu = np.exp(p_nu[0])*np.exp(p_nu[1]/temperature+p_nu[2]*temperature+p_nu[3]*temperature**2) #in mPa s
-        vu = nu/rhof #in cSt    
-        rhof = rhof*1e3 #in kg/m3
-
-    if type_sample == 'S60S':
-        p_rhof = [-0.0006154176610978536,0.8740448687350836]
-        rhof = p_rhof[0]*temperature + p_rhof[1] #in g/cm3  
-        p_nu = [5.18619877,12.28192665,-0.04623777,0.00011475]
-        nu = np.exp(p_nu[0])*np.exp(p_nu[1]/temperature+p_nu[2]*temperature+p_nu[3]*temperature**2) #in mPa s
-        vu = nu/rhof #in cSt    
-        rhof = rhof*1e3 #in kg/m3
-
-    if type_sample == 'S600S':
-        p_rhof = [-0.000581334222815211,0.889698398932622]
-        rhof = p_rhof[0]*temperature + p_rhof[1] #in g/cm3  
-        p_nu = [8.13224726879007,14.6503135839463,-0.0662712860081032,0.000173827010406862]
-        nu = np.exp(p_nu[0])*np.exp(p_nu[1]/temperature+p_nu[2]*temperature+p_nu[3]*temperature**2) #in mPa s
-        vu = nu/rhof #in cSt    
-        rhof = rhof*1e3 #in kg/m3
-    
-    return rhof, vu
+# calculation for UT properties from a stack of signals (records x samples) sharing the same time vector
+# returns one array per quantity of results_cal, records where a reflection is not found are set to NaN
+def results_cal_batch(protimevec,proData,nFreq,nCycles,timecutoff):
+    pathlength = 0.015 #pathlength is 0.015m by default, the active area
+    fac_thd = 0.1 #threshold for peak identification, 0.1 of the maximum amplitude of reflected signal
+
+    protimevec = np.asarray(protimevec, dtype=float)
+    proData = np.atleast_2d(np.asarray(proData, dtype=float))
+    nRecords, nLength = proData.shape
+    nSampFreq = 1/(protimevec[1]-protimevec[0])
+    distance = 3*nSampFreq*nCycles/nFreq
+    find_index = index_finder(protimevec)
+
+    # identify the 1st reflection, the window after the cutoff is the same for every record
+    indexcutoff = find_index(timecutoff)
+    window = proData[:,indexcutoff:]
+    height = fac_thd*np.max(window, axis=1)
+    indexPeak1 = np.array([first_peak(window[n], height[n], distance) for n in range(nRecords)], dtype=int)
+    found = indexPeak1 >= 0
+    indexPeak1 = np.where(found, indexPeak1+indexcutoff, 1)
+
+    # get the time of arrival for the 1st reflection and index with interpolation
+    dT = protimevec[indexPeak1]-protimevec[indexPeak1-1]
+    Int_T1 = peak_interp(protimevec, proData, indexPeak1, dT)
+
+    # identify the 2nd reflection, windows start at a different index for each record
+    timecutoff2 = protimevec[indexPeak1]+8e-6
+    indexcutoff = np.array([find_index(t) for t in timecutoff2], dtype=int)
+    indexend = np.array([find_index(t+3e-6) for t in timecutoff2], dtype=int)
+    nWindow = max(int(np.max(indexend-indexcutoff)), 1)
+    indexWindow = indexcutoff[:,None]+np.arange(nWindow)
+    window = np.take_along_axis(proData, np.minimum(indexWindow, nLength-1), axis=1)
+    window[indexWindow >= indexend[:,None]] = -np.inf
+    height = fac_thd*np.max(window, axis=1)
+    indexPeak2 = np.array([first_peak(window[n,:indexend[n]-indexcutoff[n]], height[n], distance) if found[n] else -1
+                           for n in range(nRecords)], dtype=int)
+    found &= indexPeak2 >= 0
+    indexPeak2 = np.where(found, indexPeak2+indexcutoff, 1)
+
+    # get the time of arrival for the 2nd reflection and index with interpolation
+    Int_T2 = peak_interp(protimevec, proData, indexPeak2, dT)
+
+    # calculate velocity of sound (values of records without reflections are discarded below)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        TOF = Int_T2 - Int_T1
+        vel = 2*pathlength/TOF
+        Peak1 = proData[np.arange(nRecords),indexPeak1]
+        Peak2 = proData[np.arange(nRecords),indexPeak2]
+        # calculate attenuation/relative amplitude from time domain
+        atten = -1*np.log(Peak1/Peak2)/(2*pathlength)
+
+    results = (Int_T1, Int_T2, Peak1, Peak2, vel, atten)
+    for result in results:
+        result[~found] = np.nan
+    return results
+
+# to reduce a waveform to the minimum and maximum of blocks of samples, at most nColumns blocks (e.g. pixel columns
+# of a plot), in the order they occur so the trace looks the same as the full one, samples left over are kept as they are
+def decimate_minmax(x, y, nColumns):
+    n = len(y)
+    if n <= 2*nColumns:
+        return x, y
+    nBlock = -(-n//nColumns)
+    nBlocks = n//nBlock
+    m = nBlock*nBlocks
+    blocks = y[:m].reshape(nBlocks, nBlock)
+    index = np.sort(np.stack([np.argmin(blocks, axis=1), np.argmax(blocks, axis=1)], axis=1), axis=1)
+    index = np.concatenate([(index + nBlock*np.arange(nBlocks)[:,None]).ravel(), np.arange(m, n)])
+    return x[index], y[index]
+
+# table of reference fluids (see the file for the units and equations), shipped in data/ next to dwflib
+FLUID_TABLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'FluidSet.csv')
+
+# to load the reference fluids from a table, returns the coefficients (rhof_a, rhof_b, nu_0..nu_3) by sample label
+# lines starting with '#' are comments, the table is read once per path
+@lru_cache(maxsize=None)
+def fluid_table(path=FLUID_TABLE):
+    if not os.path.isfile(path):
+        raise FileNotFoundError("Reference fluid table %s not found, it is installed with the package as data/FluidSet.csv" % path)
+    with open(path, newline='') as f:
+        rows = [row for row in csv.reader(f) if row and not row[0].lstrip().startswith('#')]
+    header = [name.strip() for name in rows[0]]
+    iCoefs = [header.index(name) for name in ('rhof_a', 'rhof_b', 'nu_0', 'nu_1', 'nu_2', 'nu_3')]
+    return {row[0].strip(): np.array([float(row[i]) for i in iCoefs]) for row in rows[1:]}
+
+# get density (kg/m3) and kinematic viscosity (cSt) of known samples depending on temperature (degC)
+# temperature can be an array, both results then have its shape; unknown samples give zeros
+def rhofvu(temperature,type_sample):
+    p = fluid_table().get(type_sample)
+    if p is None:
+        if np.ndim(temperature) == 0:
+            return 0, 0
+        return np.zeros(np.shape(temperature)), np.zeros(np.shape(temperature))
+
+    T = np.asarray(temperature, dtype=float)
+    with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+        rhof = p[0]*T + p[1] #in g/cm3
+        nu = np.exp(p[2])*np.exp(p[3]/T+p[4]*T+p[5]*T**2) #in mPa s
+        vu = nu/rhof #in cSt
+    rhof = rhof*1e3 #in kg/m3
+    return rhof[()], vu[()]
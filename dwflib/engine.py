@@ -0,0 +1,131 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Processing engine running signal_process and results_cal for acquired signals in worker processes.
+    Author:  Jinrui Huang
+    Revision:  16-10-2026
+    Requires:  Python 3.8
+
+"""
+
+import os
+import queue
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from multiprocessing import shared_memory
+import numpy as np
+from dwflib.dataprocess import signal_process, results_cal
+
+# to process one signal: filter/up-sample it, then get (toa1, toa2, peak1, peak2, vel, atten)
+def process_frame(timevec, arData, Filt, UpSamp, nFreq, nCycles, tCutoff):
+    (protimevec, proData) = signal_process(timevec, arData, Filt, UpSamp, nFreq)
+    return tuple(float(x) for x in results_cal(protimevec, proData, nFreq, nCycles, tCutoff))
+
+# shared memory blocks attached in this worker process, by name
+_attached = {}
+
+# to process the signal in a shared memory slot (time vector in row 0, signal in row 1), run in the workers
+def process_shared(name, nLength, Filt, UpSamp, nFreq, nCycles, tCutoff):
+    if name not in _attached:
+        _attached[name] = shared_memory.SharedMemory(name=name)
+    slot = np.ndarray((2, nLength), dtype=np.float64, buffer=_attached[name].buf)
+    return process_frame(slot[0], slot[1], Filt, UpSamp, nFreq, nCycles, tCutoff)
+
+
+class ProcessEngine(object):
+    # Processes signals in a pool of nWorkers processes, so up-sampling and peak finding do not compete with the GUI
+    # and acquisition threads for the GIL. Each submitted signal is copied into one of nSlots shared memory slots
+    # (reused, submit() waits for a free one) and only the slot name goes to the worker. Results are returned in the
+    # order the signals were submitted, each with the tag given to submit(). A signal whose processing fails (e.g. no
+    # reflection found) is reported, counted in nFailed and left out, the others are still returned. With nWorkers=0
+    # the signals are processed in the calling thread when they are submitted.
+
+    def __init__(self, nWorkers=None, nLength=8192, nSlots=None):
+        if nWorkers is None:
+            nWorkers = max((os.cpu_count() or 2) - 1, 1)
+        self.nWorkers = nWorkers
+        self.nLength = nLength  # longest signal that fits in a slot
+        self.nSlots = nSlots if nSlots is not None else 2 * max(nWorkers, 1)
+        self.pool = None
+        self.shms = []  # shared memory blocks of the slots
+        self.slots = []  # (2, nLength) arrays over the blocks
+        self.free = queue.Queue()  # indices of the slots not in use
+        self.inflight = deque()  # (tag, future) in submission order
+        self.nFailed = 0  # signals whose processing raised, left out of the results
+
+    def start(self):
+        if self.pool is not None or self.nWorkers == 0:
+            return
+        for i in range(self.nSlots):
+            shm = shared_memory.SharedMemory(create=True, size=2 * self.nLength * 8)
+            self.shms.append(shm)
+            self.slots.append(np.ndarray((2, self.nLength), dtype=np.float64, buffer=shm.buf))
+            self.free.put(i)
+        # workers are spawned, not forked: the pool is started while the GUI, acquisition, temperature and writer
+        # threads run, a forked worker could inherit one of their locks held and deadlock
+        self.pool = ProcessPoolExecutor(max_workers=self.nWorkers, mp_context=multiprocessing.get_context('spawn'))
+
+    def submit(self, tag, timevec, arData, Filt, UpSamp, nFreq, nCycles, tCutoff):
+        # queue one signal for processing
+        if self.nWorkers == 0:
+            future = Future()
+            try:
+                future.set_result(process_frame(timevec, arData, Filt, UpSamp, nFreq, nCycles, tCutoff))
+            except Exception as e:
+                future.set_exception(e)
+            self.inflight.append((tag, future))
+            return
+        self.start()
+        nLength = len(arData)
+        if nLength > self.nLength:
+            raise ValueError("Signal of %d samples does not fit in the %d sample slots" % (nLength, self.nLength))
+        i = self.free.get()
+        self.slots[i][0, :nLength] = timevec
+        self.slots[i][1, :nLength] = arData
+        future = self.pool.submit(process_shared, self.shms[i].name, nLength, Filt, UpSamp, nFreq, nCycles, tCutoff)
+        future.add_done_callback(lambda f, i=i: self.free.put(i))
+        self.inflight.append((tag, future))
+
+    def pending(self):
+        # number of signals whose results were not returned yet
+        return len(self.inflight)
+
+    def ready(self):
+        # results available now, as a list of (tag, result) in submission order, without waiting
+        done = []
+        while self.inflight and self.inflight[0][1].done():
+            self.collect(done)
+        return done
+
+    def drain(self):
+        # wait for all submitted signals, returns their (tag, result) in submission order
+        done = []
+        while self.inflight:
+            self.collect(done)
+        return done
+
+    def collect(self, done):
+        # add the result of the oldest signal to done, waiting for it, a failed one is only reported
+        tag, future = self.inflight.popleft()
+        try:
+            done.append((tag, future.result()))
+        except Exception as e:
+            self.nFailed += 1
+            print("Processing failed, signal skipped: %s: %s" % (type(e).__name__, e))
+
+    def discard(self):
+        # forget the signals not returned yet (their slots are still freed when the workers finish)
+        self.inflight.clear()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+        self.inflight.clear()
+        self.slots = []
+        for shm in self.shms:
+            shm.close()
+            shm.unlink()
+        self.shms = []
+        self.free = queue.Queue()
@@ -0,0 +1,49 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Frame queue handing acquired signals from the acquisition thread to the recording thread.
+    Author:  Jinrui Huang
+    Revision:  16-10-2026
+    Requires:  Python 3.5
+
+"""
+
+import threading
+from collections import deque, namedtuple
+
+# one acquired signal with the settings it was acquired with, seq counts the frames put into a queue from 1
+Frame = namedtuple('Frame', ['seq', 'timevec', 'arData', 'vch2', 'temp', 'nFreq', 'nAmplitude', 'gain'])
+
+class FrameQueue(object):
+    # Frames go from one producer to one consumer in order, each frame is returned by get() once. The queue keeps the
+    # last nMax frames: the producer never waits, if the consumer falls behind the oldest frames are discarded
+    # (counted in nDropped, and visible to the consumer as a jump in seq).
+
+    def __init__(self, nMax=8):
+        self.frames = deque(maxlen=nMax)
+        self.cond = threading.Condition()
+        self.nSeq = 0  # sequence number of the last frame put
+        self.nDropped = 0  # frames discarded unread
+
+    def put(self, timevec, arData, vch2, temp, nFreq, nAmplitude, gain):
+        # add a frame, the arrays must not be modified afterwards by the producer
+        with self.cond:
+            if len(self.frames) == self.frames.maxlen:
+                self.nDropped += 1
+            self.nSeq += 1
+            frame = Frame(self.nSeq, timevec, arData, vch2, temp, nFreq, nAmplitude, gain)
+            self.frames.append(frame)
+            self.cond.notify()
+            return frame
+
+    def get(self, timeout=None):
+        # oldest frame not read yet, waits up to timeout seconds for one (None for no limit), None on timeout
+        with self.cond:
+            if not self.cond.wait_for(lambda: len(self.frames) > 0, timeout):
+                return None
+            return self.frames.popleft()
+
+    def clear(self):
+        # discard the frames not read yet, e.g. before a new recording starts
+        with self.cond:
+            self.frames.clear()
@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Polling strategy for waiting on acquisitions, with wait time and status call statistics.
+    Author:  Jinrui Huang
+    Revision:  16-10-2026
+    Requires:  Python 3.5
+
+"""
+
+import math
+import time
+import numpy as np
+
+class FramePoller(object):
+    # Waits for the next frame of a repeated acquisition. The frame is predicted from the frame period (refined with
+    # the measured periods during a run): the poller sleeps until shortly before it is due, then calls the status
+    # function in a loop, yielding to other threads between calls. If the frame is later than one period past the
+    # prediction, it backs off to short sleeps between calls.
+
+    def __init__(self, tFrame, tSpin=2e-4, fac_smooth=0.1, nCallsMax=64):
+        self.tFrame = tFrame  # predicted frame period in seconds
+        self.tSpin = tSpin  # stop sleeping this long before a frame is due, in seconds
+        self.fac_smooth = fac_smooth  # weight of the last measured period in the frame period estimate
+        self.nCallsMax = nCallsMax  # status calls per frame above this go into the last histogram bin
+        self.nDecadeBins = 10  # wait time histogram bins per decade, from 1 us to 10 s
+        self.waitEdges = np.logspace(-6, 1, 7 * self.nDecadeBins + 1)
+        self.tLast = None  # time the last frame was done, None at the start of a run
+        self.reset()
+
+    def reset(self):
+        # clear the statistics
+        self.waitCounts = np.zeros(len(self.waitEdges) + 1, dtype=int)  # first and last bins hold under/overflows
+        self.callCounts = np.zeros(self.nCallsMax + 1, dtype=int)  # index is the number of status calls
+        self.nFrames = 0
+        self.tWaitTotal = 0.0
+        self.tWaitMax = 0.0
+        self.nCallsTotal = 0
+
+    def start(self):
+        # to be called before the first frame of a run, so the time spent between runs is not taken as a frame period
+        self.tLast = None
+
+    def wait(self, isdone):
+        # wait until isdone() returns True, returns the number of calls it took
+        tStart = time.perf_counter()
+        nCalls = 0
+        tDue = tStart
+        if self.tLast is not None:
+            tDue = self.tLast + self.tFrame
+            tSleep = tDue - self.tSpin - tStart
+            if tSleep > 0:
+                time.sleep(tSleep)
+        while True:
+            nCalls += 1
+            if isdone():
+                break
+            if time.perf_counter() - tDue > self.tFrame:
+                # prediction missed, stop spinning
+                time.sleep(min(self.tFrame / 4, 1e-3))
+            else:
+                time.sleep(0)
+        tEnd = time.perf_counter()
+        if self.tLast is not None:
+            self.tFrame += self.fac_smooth * ((tEnd - self.tLast) - self.tFrame)
+        self.tLast = tEnd
+        self.record(tEnd - tStart, nCalls)
+        return nCalls
+
+    def record(self, tWait, nCalls):
+        # add one frame to the statistics
+        if tWait > 0:
+            iBin = int(math.floor((math.log10(tWait) + 6) * self.nDecadeBins)) + 1
+        else:
+            iBin = 0
+        self.waitCounts[min(max(iBin, 0), len(self.waitCounts) - 1)] += 1
+        self.callCounts[min(nCalls, self.nCallsMax)] += 1
+        self.nFrames += 1
+        self.tWaitTotal += tWait
+        self.tWaitMax = max(self.tWaitMax, tWait)
+        self.nCallsTotal += nCalls
+
+    def histogram(self):
+        # wait time histogram (bin edges in seconds and counts, including the under/overflow bins)
+        # and status call histogram (counts indexed by number of calls, the last bin is nCallsMax or more)
+        return self.waitEdges, self.waitCounts.copy(), self.callCounts.copy()
+
+    def stats(self):
+        # summary of the frames recorded since the last reset
+        nFrames = max(self.nFrames, 1)
+        return {'frames': self.nFrames,
+                'wait_mean': self.tWaitTotal / nFrames,
+                'wait_max': self.tWaitMax,
+                'calls_mean': self.nCallsTotal / nFrames,
+                'period': self.tFrame}
@@ -0,0 +1,178 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Offline reprocessing of recorded signals: recalculates the Data_* tables from Signal_* files (.csv, .npy or .wfa).
+    Author:  Jinrui Huang
+    Revision:  16-10-2026
+    Requires:  Python 3.5
+    Usage:  python -m dwflib.reprocess Signal_*.csv [--out DIR] [--no-filter] [--no-upsample] [--workers N] ...
+            (python -m dwflib.reprocess --help for all options)
+
+"""
+
+import os
+import re
+import glob
+import argparse
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from dwflib.dataprocess import signal_process, results_cal_batch, rhofvu
+from dwflib.storage import DATA_COLUMNS, DATA_DTYPE, DATA_FMT, NpyAppender, WaveArchive
+
+# file names written by DWF.getdata and the GUI: Signal_<sample>_<amp>v_<freq>hz_<gain>.csv (or .npy, .wfa)
+SIGNAL_NAME = re.compile(r'^Signal_(?P<sample>.+)_(?P<amp>[^_]+)v_(?P<freq>[^_]+)hz_(?P<gain>.+)\.(?P<ext>csv|npy|wfa)$')
+
+# to read the signals of a file in chunks of nChunk records (records x samples), without loading the whole file
+def read_chunks(path, nChunk):
+    if path.endswith('.npy') or path.endswith('.wfa'):
+        signal = WaveArchive(path).records() if path.endswith('.wfa') else np.load(path, mmap_mode='r')
+        for i in range(0, len(signal), nChunk):
+            yield np.array(signal[i:i + nChunk], dtype=float)
+        return
+    with open(path) as f:
+        while True:
+            lines = list(itertools.islice(f, nChunk))
+            if not lines:
+                break
+            yield np.loadtxt(lines, delimiter=',', ndmin=2)
+
+# to read temperature and PT1000 voltage of each record from the Data_* file next to a Signal_* file
+# missing files or records give NaN
+def read_conditions(path):
+    folder, name = os.path.split(path)
+    # the results of a .wfa archive are in a .npy table (Data_<label>.wfa.npy)
+    dataPath = os.path.join(folder, 'Data_' + name[len('Signal_'):])
+    if dataPath.endswith('.wfa'):
+        dataPath += '.npy'
+    if not os.path.isfile(dataPath):
+        return np.zeros(0), np.zeros(0)
+    if dataPath.endswith('.npy'):
+        data = np.load(dataPath)
+        return np.asarray(data['temp'], dtype=float), np.asarray(data['vch2'], dtype=float)
+    data = np.loadtxt(dataPath, delimiter=',', ndmin=2)
+    return data[:, DATA_COLUMNS.index('temp')], data[:, DATA_COLUMNS.index('vch2')]
+
+# to process a chunk of signals, returns the rows of the Data_* table (records x DATA_COLUMNS)
+def process_chunk(arData, temp, vch2, sample, nFreq, nSampFreq, nCycles, tCutoff, Filt, UpSamp):
+    nRecLength = arData.shape[1]
+    timevec = np.arange(0, nRecLength / nSampFreq, 1 / nSampFreq)[:nRecLength]
+    (protimevec, proData) = signal_process(timevec, arData, Filt, UpSamp, nFreq)
+    toa1, toa2, peak1, peak2, vel, atten = results_cal_batch(protimevec, proData, nFreq, nCycles, tCutoff)
+    (rhof, visc) = rhofvu(temp, sample)
+    return np.column_stack([temp, toa1, toa2, peak1, peak2, vch2, atten, rhof, visc])
+
+# to pick n values from an array starting at i, padded with NaN past its end
+def take(values, i, n):
+    out = np.full(n, np.nan)
+    part = values[i:i + n]
+    out[:len(part)] = part
+    return out
+
+# processing settings of DWF, used where they are neither given nor in the header of a .wfa archive
+PROCESSING = {'nCycles': 5, 'tCutoff': 1.10e-4, 'Filt': True, 'UpSamp': True}
+
+# to reprocess Signal_* files into Data_* tables in folder out, chunks from all files are processed in nWorkers
+# processes (in this process if nWorkers is 0) while the next ones are read, results are written in record order
+# nCycles, tCutoff, Filt and UpSamp left as None are taken from the archive header as recorded, else PROCESSING
+def reprocess(paths, out, nSampFreq=50e6, nCycles=None, tCutoff=None, Filt=None, UpSamp=None, nChunk=32,
+              nWorkers=None, fmt='csv'):
+    given = {name: value for name, value in zip(('nCycles', 'tCutoff', 'Filt', 'UpSamp'), (nCycles, tCutoff, Filt, UpSamp))
+             if value is not None}
+    if not os.path.exists(out):
+        os.makedirs(out)
+    if nWorkers is None:
+        nWorkers = os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=nWorkers) if nWorkers > 0 else None
+    nInflight = 2 * max(nWorkers, 1)  # chunks submitted but not written yet, at most
+    inflight = deque()  # (writer, future) in submission order
+    writers = []
+    outPaths = set()
+    try:
+        for path in paths:
+            match = SIGNAL_NAME.match(os.path.basename(path))
+            if match is None:
+                print("Skipping %s (not a Signal_<sample>_<amp>v_<freq>hz_<gain> file)" % path)
+                continue
+            label = os.path.basename(path)[len('Signal_'):-len('.' + match.group('ext'))]
+            if os.path.abspath(out) == os.path.dirname(os.path.abspath(path)):
+                raise ValueError("Output folder %s is the folder of %s, its Data_* files would be overwritten" % (out, path))
+            outPath = os.path.join(out, 'Data_' + label + '.' + fmt)
+            if outPath in outPaths:
+                print("Skipping %s (Data_%s.%s already written from another file)" % (path, label, fmt))
+                continue
+            outPaths.add(outPath)
+            if os.path.exists(outPath):
+                os.remove(outPath)
+            writer = NpyAppender(outPath, DATA_DTYPE) if fmt == 'npy' else open(outPath, 'w')
+            writers.append(writer)
+            temps, vch2s = read_conditions(path)
+            # archives have the sampling and tone-burst frequencies and the processing settings in their header
+            nFileSampFreq = nSampFreq
+            nFreq = float(match.group('freq'))
+            processing = dict(PROCESSING)
+            if match.group('ext') == 'wfa':
+                settings = WaveArchive(path).settings
+                nFileSampFreq = settings['nSampFreq'] or nSampFreq
+                nFreq = settings['nFreq'] or nFreq
+                processing.update((name, settings[name]) for name in PROCESSING if settings.get(name) is not None)
+            processing.update(given)
+            nRecords = 0
+            print("Reprocessing %s" % path)
+            for arData in read_chunks(path, nChunk):
+                n = len(arData)
+                args = (arData, take(temps, nRecords, n), take(vch2s, nRecords, n), match.group('sample'),
+                        nFreq, nFileSampFreq, processing['nCycles'], processing['tCutoff'], processing['Filt'],
+                        processing['UpSamp'])
+                nRecords += n
+                if pool is None:
+                    write_rows(writer, process_chunk(*args))
+                    continue
+                inflight.append((writer, pool.submit(process_chunk, *args)))
+                while len(inflight) >= nInflight:
+                    writer_done, future = inflight.popleft()
+                    write_rows(writer_done, future.result())
+        while inflight:
+            writer_done, future = inflight.popleft()
+            write_rows(writer_done, future.result())
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True)
+        for writer in writers:
+            writer.close()
+
+# to append rows to a Data_* table, written as a .csv file (open file) or .npy file (NpyAppender)
+def write_rows(writer, rows):
+    if isinstance(writer, NpyAppender):
+        writer.append(np.rec.fromarrays(rows.T, dtype=DATA_DTYPE))
+    else:
+        np.savetxt(writer, rows, fmt=DATA_FMT, delimiter=',')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m dwflib.reprocess',
+                                     description='Recalculate Data_* tables from recorded Signal_* files.')
+    parser.add_argument('files', nargs='+', help='Signal_*.csv, Signal_*.npy or Signal_*.wfa files (wildcards allowed)')
+    parser.add_argument('--out', default='reprocessed', help='folder for the Data_* tables (default: reprocessed)')
+    parser.add_argument('--format', dest='fmt', choices=['csv', 'npy'], default='csv', help='format of the Data_* tables')
+    parser.add_argument('--fs', type=float, default=50e6, help='sampling frequency of .csv/.npy signals in Hz (default: 50e6)')
+    parser.add_argument('--cycles', type=int, default=None,
+                        help='number of cycles of the tone-burst (default: as recorded in .wfa archives, else 5)')
+    parser.add_argument('--cutoff', type=float, default=None,
+                        help='time to start looking for reflections in s (default: as recorded in .wfa archives, else 1.1e-4)')
+    parser.add_argument('--filter', dest='Filt', action='store_true', default=None,
+                        help='apply the band-pass filter (0.5 to 1.5 times the tone-burst frequency) (default: as recorded, else on)')
+    parser.add_argument('--no-filter', dest='Filt', action='store_false', help='do not apply the band-pass filter')
+    parser.add_argument('--upsample', dest='UpSamp', action='store_true', default=None,
+                        help='up-sample to 1 GHz (default: as recorded, else on)')
+    parser.add_argument('--no-upsample', dest='UpSamp', action='store_false', help='do not up-sample to 1 GHz')
+    parser.add_argument('--chunk', type=int, default=32, help='records processed at once (default: 32)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, 0 for none (default: one per core)')
+    args = parser.parse_args(argv)
+
+    paths = sorted(set(itertools.chain.from_iterable(glob.glob(pattern) or [pattern] for pattern in args.files)))
+    reprocess(paths, args.out, args.fs, args.cycles, args.cutoff, args.Filt, args.UpSamp, args.chunk,
+              args.workers, args.fmt)
+
+if __name__ == "__main__":
+    main()
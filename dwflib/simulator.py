@@ -0,0 +1,298 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Simulated Analog Discovery 2 with the FDwf* calls used by dwflib.DWF, for running without the device.
+    Author:  Jinrui Huang
+    Revision:  16-10-2026
+    Requires:  Python 3.5
+    Usage:  DWF(backend=DwfSimulator()) or DWF(backend='sim')
+
+"""
+
+import time
+import ctypes
+import numpy as np
+from dwflib.dwfconstants import *
+
+# value of a ctypes argument, byref() argument or plain Python number
+def _value(arg):
+    arg = getattr(arg, '_obj', arg)
+    return getattr(arg, 'value', arg)
+
+# set the value of a byref() argument
+def _set(ref, value):
+    getattr(ref, '_obj', ref).value = value
+
+class DwfSimulator(object):
+    # Stands in for the dwf library. The oscilloscope channel 1 receives the tone-burst loaded into waveform generator 1
+    # as a train of nEchoes waveguide reflections: the first tof1 seconds after the trigger, then one every tof seconds,
+    # each smaller by exp(-2*atten*pathlength) (atten in Np/m, results_cal gives it with a negative sign) and delayed by
+    # a random trigger jitter (standard deviation in seconds) shared by the echoes of a frame. Channel 2 reads the PT1000 voltage vch2.
+    # Both get Gaussian noise (standard deviation in V) and are clipped to the input range. The amplitude is scaled by
+    # gain factors of the DIO lines set with FDwfDigitalOutCounterInitSet.
+    # With realtime set, acquisitions are done at the rate the tone-burst repeats (run + wait time of generator 1),
+    # otherwise immediately. In record mode each FDwfAnalogInStatusRecord delivers up to nChunk samples, a fraction
+    # pLost of the reads reports lost samples.
+
+    def __init__(self, tof1=120e-6, tof=9.6e-6, atten=20.0, pathlength=0.015, nEchoes=2, noise=0.01, jitter=1e-9,
+                 vch2=1.2, gains=(2.0, 4.0, 2.0, 4.0), realtime=False, nChunk=65536, pLost=0.0, seed=None, bPresent=True):
+        self.tof1 = tof1  # arrival time of the first reflection after the trigger in s
+        self.tof = tof  # time between reflections in s
+        self.atten = atten  # attenuation in Np/m
+        self.pathlength = pathlength  # one-way path in m, the echoes decay by exp(-2*atten*pathlength)
+        self.nEchoes = nEchoes
+        self.noise = noise  # noise standard deviation in V
+        self.jitter = jitter  # trigger jitter standard deviation in s
+        self.vch2 = vch2  # channel 2 voltage in V
+        self.gains = gains  # amplitude factor of each DIO line when it is high
+        self.realtime = realtime
+        self.nChunk = nChunk  # samples per record mode read at most
+        self.pLost = pLost  # probability that a record mode read reports lost samples
+        self.bPresent = bPresent  # False to simulate no device connected
+        self.rng = np.random.default_rng(seed)
+        self.nOpen = 0  # device handles given out
+        self.nStatus = 0  # FDwfAnalogInStatus calls
+        self.reset()
+
+    def reset(self):
+        # device state after opening
+        self.nSampFreq = 100e6
+        self.nBuffer = 8192
+        self.range = [5.0, 5.0]
+        self.offset = [0.0, 0.0]
+        self.tPosition = 0.0
+        self.mode = acqmodeSingle.value
+        self.tRecord = 0.0
+        self.awgData = np.zeros(0)
+        self.awgFreq = 1e3
+        self.awgAmplitude = 1.0
+        self.awgRun = 0.0
+        self.awgWait = 0.0
+        self.dio = [0, 0, 0, 0]
+        self.data = np.zeros((2, self.nBuffer))  # last acquisition, or last record mode chunk
+        self.running = False
+        self.tNext = 0.0  # time the next frame is done when running in real time
+        self.nRecorded = 0  # record mode samples delivered so far
+        self.nLostPending = 0
+
+    # device
+    def FDwfGetVersion(self, version):
+        version.value = b'simulator'
+        return 1
+
+    def FDwfGetLastErrorMsg(self, szError):
+        szError.value = b'' if self.bPresent else b'Simulated device not connected'
+        return 1
+
+    def FDwfDeviceOpen(self, idxDevice, phdwf):
+        if not self.bPresent:
+            _set(phdwf, hdwfNone.value)
+            return 0
+        self.reset()
+        self.nOpen += 1
+        _set(phdwf, self.nOpen)
+        return 1
+
+    def FDwfDeviceConfigOpen(self, idxDevice, idxCfg, phdwf):
+        return self.FDwfDeviceOpen(idxDevice, phdwf)
+
+    def FDwfDeviceCloseAll(self):
+        self.running = False
+        return 1
+
+    def FDwfDeviceTriggerSet(self, hdwf, idxPin, trigsrc):
+        return 1
+
+    # waveform generator, only generator 1 matters for the echoes
+    def FDwfAnalogOutNodeEnableSet(self, hdwf, idxChannel, node, fEnable):
+        return 1
+
+    def FDwfAnalogOutNodeFunctionSet(self, hdwf, idxChannel, node, func):
+        return 1
+
+    def FDwfAnalogOutNodeDataSet(self, hdwf, idxChannel, node, rgdData, cdData):
+        if _value(idxChannel) == 0:
+            n = _value(cdData)
+            self.awgData = np.ctypeslib.as_array(ctypes.cast(rgdData, ctypes.POINTER(ctypes.c_double)), (n,)).copy()
+        return 1
+
+    def FDwfAnalogOutNodeFrequencySet(self, hdwf, idxChannel, node, hzFrequency):
+        if _value(idxChannel) == 0:
+            self.awgFreq = _value(hzFrequency)
+        return 1
+
+    def FDwfAnalogOutNodeAmplitudeSet(self, hdwf, idxChannel, node, vAmplitude):
+        if _value(idxChannel) == 0:
+            self.awgAmplitude = _value(vAmplitude)
+        return 1
+
+    def FDwfAnalogOutNodeOffsetSet(self, hdwf, idxChannel, node, vOffset):
+        return 1
+
+    def FDwfAnalogOutRunSet(self, hdwf, idxChannel, secRun):
+        if _value(idxChannel) == 0:
+            self.awgRun = _value(secRun)
+        return 1
+
+    def FDwfAnalogOutWaitSet(self, hdwf, idxChannel, secWait):
+        if _value(idxChannel) == 0:
+            self.awgWait = _value(secWait)
+        return 1
+
+    def FDwfAnalogOutRepeatSet(self, hdwf, idxChannel, cRepeat):
+        return 1
+
+    def FDwfAnalogOutConfigure(self, hdwf, idxChannel, fStart):
+        return 1
+
+    # digital outputs setting the amplifier gains
+    def FDwfDigitalOutCounterInitSet(self, hdwf, idxChannel, fHigh, cCounterInit):
+        self.dio[_value(idxChannel)] = 1 if _value(fHigh) else 0
+        return 1
+
+    def FDwfDigitalOutEnableSet(self, hdwf, idxChannel, fEnable):
+        return 1
+
+    def FDwfDigitalOutConfigure(self, hdwf, fStart):
+        return 1
+
+    # oscilloscope
+    def FDwfAnalogInFrequencySet(self, hdwf, hzFrequency):
+        self.nSampFreq = _value(hzFrequency)
+        return 1
+
+    def FDwfAnalogInBufferSizeSet(self, hdwf, nSize):
+        self.nBuffer = _value(nSize)
+        return 1
+
+    def FDwfAnalogInChannelEnableSet(self, hdwf, idxChannel, fEnable):
+        return 1
+
+    def FDwfAnalogInChannelRangeSet(self, hdwf, idxChannel, voltsRange):
+        self.range[_value(idxChannel)] = _value(voltsRange)
+        return 1
+
+    def FDwfAnalogInChannelOffsetSet(self, hdwf, idxChannel, voltOffset):
+        self.offset[_value(idxChannel)] = _value(voltOffset)
+        return 1
+
+    def FDwfAnalogInTriggerPositionSet(self, hdwf, secPosition):
+        self.tPosition = _value(secPosition)
+        return 1
+
+    def FDwfAnalogInAcquisitionModeSet(self, hdwf, acqmode):
+        self.mode = _value(acqmode)
+        return 1
+
+    def FDwfAnalogInRecordLengthSet(self, hdwf, sLength):
+        self.tRecord = _value(sLength)
+        return 1
+
+    def FDwfAnalogInConfigure(self, hdwf, fReconfigure, fStart):
+        if _value(fStart):
+            self.running = True
+            self.tNext = time.perf_counter() + self.period()
+            self.nRecorded = 0
+        return 1
+
+    def FDwfAnalogInStatus(self, hdwf, fReadData, psts):
+        self.nStatus += 1
+        if not self.running:
+            _set(psts, DwfStateReady.value)
+            return 1
+        if self.mode == acqmodeRecord.value:
+            nTotal = int(round(self.tRecord * self.nSampFreq))
+            _set(psts, DwfStateDone.value if self.nRecorded >= nTotal else DwfStateRunning.value)
+            return 1
+        if self.realtime:
+            tNow = time.perf_counter()
+            if tNow < self.tNext:
+                _set(psts, DwfStateArmed.value)
+                return 1
+            # frames missed while not polling are skipped, as the device re-arms after each acquisition
+            self.tNext += self.period() * max(1, np.ceil((tNow - self.tNext) / self.period()))
+        # the frame is synthesized when it is read, so the status call stays as quick as the device's
+        self.data = None
+        _set(psts, DwfStateDone.value)
+        return 1
+
+    def FDwfAnalogInStatusData(self, hdwf, idxChannel, rgdVoltData, cdData):
+        if self.data is None:
+            self.data = self.frames(1, self.nBuffer, self.tPosition - (self.nBuffer - 1) / self.nSampFreq / 2)[:, 0]
+        n = min(_value(cdData), self.data.shape[1])
+        ctypes.memmove(rgdVoltData, self.data[_value(idxChannel)].ctypes.data, n * ctypes.sizeof(ctypes.c_double))
+        return 1
+
+    def FDwfAnalogInStatusData2(self, hdwf, idxChannel, rgdVoltData, idxData, cdData):
+        i = _value(idxData)
+        n = min(_value(cdData), self.data.shape[1] - i)
+        ctypes.memmove(rgdVoltData, self.data[_value(idxChannel), i:].ctypes.data, n * ctypes.sizeof(ctypes.c_double))
+        return 1
+
+    def FDwfAnalogInStatusRecord(self, hdwf, pcdDataAvailable, pcdDataLost, pcdDataCorrupt):
+        # deliver the next chunk of the record, the tone-burst starts at the trigger and repeats every period
+        nTotal = int(round(self.tRecord * self.nSampFreq))
+        n = min(self.nChunk, nTotal - self.nRecorded)
+        nLost = 0
+        if n > 0 and self.pLost > 0 and self.rng.random() < self.pLost:
+            nLost = int(self.rng.integers(1, n + 1))
+            self.nRecorded += nLost
+            n = min(n, nTotal - self.nRecorded)
+        self.data = self.stream(self.nRecorded, n)
+        self.nRecorded += n
+        _set(pcdDataAvailable, n)
+        _set(pcdDataLost, nLost)
+        _set(pcdDataCorrupt, 0)
+        return 1
+
+    def __getattr__(self, name):
+        # other FDwf* settings (trigger source, type, level, ...) are accepted and do not change the simulation
+        if name.startswith('FDwf'):
+            return lambda *args: 1
+        raise AttributeError(name)
+
+    # signal synthesis
+    def period(self):
+        # repeat period of the tone-burst in s
+        return max(self.awgRun + self.awgWait, 1.0 / self.nSampFreq)
+
+    def gain(self):
+        factor = 1.0
+        for bit, gain in zip(self.dio, self.gains):
+            if bit:
+                factor *= gain
+        return factor
+
+    def frames(self, nFrames, nSamples, t0):
+        # nFrames acquisitions of nSamples, the first sample t0 s after the trigger, as (channels, frames, samples)
+        data = np.empty((2, nFrames, nSamples))
+        t = t0 + np.arange(nSamples) / self.nSampFreq
+        echoes = np.zeros((nFrames, nSamples))
+        if len(self.awgData) > 0:
+            # time base of the generator samples, run at awgFreq repeats per second
+            tAwg = np.arange(len(self.awgData)) / (self.awgFreq * len(self.awgData))
+            pulse = self.awgAmplitude * self.gain() * self.awgData
+            delay = self.rng.normal(0, self.jitter, nFrames) if self.jitter > 0 else np.zeros(nFrames)
+            for k in range(self.nEchoes):
+                amplitude = np.exp(-2 * self.atten * self.pathlength * k)
+                for i in range(nFrames):
+                    echoes[i] += amplitude * np.interp(t - self.tof1 - k * self.tof - delay[i], tAwg, pulse, left=0, right=0)
+        data[0] = echoes
+        data[1] = self.vch2
+        if self.noise > 0:
+            data += self.rng.normal(0, self.noise, data.shape)
+        for ch in range(2):
+            vMin = self.offset[ch] - self.range[ch] / 2
+            np.clip(data[ch], vMin, vMin + self.range[ch], out=data[ch])
+        return data
+
+    def stream(self, iFirst, n):
+        # samples iFirst to iFirst+n of a record mode acquisition (channels x samples)
+        nPeriod = max(int(round(self.period() * self.nSampFreq)), 1)
+        iFrame0 = iFirst // nPeriod
+        nFrames = (iFirst + n - 1) // nPeriod - iFrame0 + 1 if n > 0 else 0
+        if nFrames == 0:
+            return np.zeros((2, 0))
+        frames = self.frames(nFrames, nPeriod, 0.0).reshape(2, -1)
+        i0 = iFirst - iFrame0 * nPeriod
+        return np.ascontiguousarray(frames[:, i0:i0 + n])
@@ -0,0 +1,450 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Storage backends for recorded data: per-record results (DATA_COLUMNS) and averaged signals.
+    Author:  Jinrui Huang
+    Revision:  16-10-2026
+    Requires:  Python 3.5, h5py (optional, for the 'hdf5' backend)
+    Usage:  python -m dwflib.storage <label> [wfa|npy|hdf5] to export a binary store to Data_<label>.csv and Signal_<label>.csv
+
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+# results saved for every record, in the column order of the Data_*.csv files
+DATA_COLUMNS = ('temp', 'toa1', 'toa2', 'peak1', 'peak2', 'vch2', 'atten', 'rhof', 'visc')
+DATA_DTYPE = np.dtype([(name, '<f8') for name in DATA_COLUMNS])
+DATA_FMT = ','.join(['%.18e'] * len(DATA_COLUMNS))
+
+
+class NpyAppender(object):
+    # A .npy file rows are appended to. The header has a fixed size and is rewritten with the number of rows on
+    # flush, so the file can be read with np.load (or np.memmap) at any time. When an existing file is opened, the
+    # number of rows is taken from the file size and an incomplete last row (e.g. after a crash) is dropped.
+    HEADER_SIZE = 512
+
+    def __init__(self, path, dtype, rowshape=()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.rowshape = tuple(rowshape)
+        self.rowbytes = self.dtype.itemsize * int(np.prod(self.rowshape, dtype=int))
+        if os.path.isfile(path):
+            self.f = open(path, 'r+b')
+            if np.lib.format.read_magic(self.f) != (1, 0):
+                self.f.close()
+                raise ValueError("%s cannot be appended to (different format version)" % path)
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(self.f)
+            if self.f.tell() != self.HEADER_SIZE or fortran_order or dtype != self.dtype or shape[1:] != self.rowshape:
+                self.f.close()
+                raise ValueError("%s cannot be appended to (different layout)" % path)
+            self.nRows = (os.path.getsize(path) - self.HEADER_SIZE) // self.rowbytes
+            self.f.truncate(self.HEADER_SIZE + self.nRows * self.rowbytes)
+        else:
+            self.f = open(path, 'w+b')
+            self.nRows = 0
+        self.writeheader()
+        self.f.seek(0, os.SEEK_END)
+
+    def writeheader(self):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (
+            np.lib.format.dtype_to_descr(self.dtype), (self.nRows,) + self.rowshape)
+        header = header.ljust(self.HEADER_SIZE - 11) + '\n'
+        self.f.seek(0)
+        self.f.write(b'\x93NUMPY\x01\x00' + np.uint16(len(header)).tobytes() + header.encode('latin1'))
+
+    def append(self, rows):
+        # append one or more rows (an array of shape (n,) + rowshape, or rowshape for a single row)
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape((-1,) + self.rowshape)
+        self.f.write(rows.tobytes())
+        self.nRows += len(rows)
+
+    def flush(self):
+        self.writeheader()
+        self.f.seek(0, os.SEEK_END)
+        self.f.flush()
+
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
+
+
+class WaveArchive(object):
+    # Signals stored as fixed-size records after a header of HEADER_SIZE bytes: MAGIC, then a JSON object with the record
+    # layout (dtype, nRecLength), the acquisition and processing settings (SETTINGS) and the number of records. Record i starts at
+    # HEADER_SIZE + i*stride, so records() maps any range of records with np.memmap without reading what comes before.
+    # Mode 'r' opens an archive read-only, 'a' appends to it (created with the given layout and settings if it does not
+    # exist) and 'w' creates a new one. As with NpyAppender, the number of records is taken from the file size.
+    MAGIC = b'DWFWAVE1'
+    HEADER_SIZE = 1024
+    SETTINGS = ('nSampFreq', 'nFreq', 'nAmplitude', 'gain', 'Filt', 'UpSamp', 'nCycles', 'tCutoff')
+
+    def __init__(self, path, mode='r', nRecLength=None, dtype='float64', **settings):
+        if mode not in ('r', 'a', 'w'):
+            raise ValueError("Unknown archive mode '%s'" % mode)
+        self.path = path
+        self.mode = mode
+        bNew = mode == 'w' or (mode == 'a' and not os.path.isfile(path))
+        if bNew:
+            if nRecLength is None:
+                raise ValueError("nRecLength is required to create %s" % path)
+            self.dtype = np.dtype(dtype)
+            self.nRecLength = int(nRecLength)
+            self.settings = {name: settings.get(name) for name in self.SETTINGS}
+        else:
+            with open(path, 'rb') as f:
+                header = self.readheader(f)
+            self.dtype = np.dtype(header['dtype'])
+            self.nRecLength = header['nRecLength']
+            self.settings = {name: header.get(name) for name in self.SETTINGS}
+            if mode == 'a' and ((nRecLength is not None and nRecLength != self.nRecLength) or np.dtype(dtype) != self.dtype):
+                raise ValueError("%s cannot be appended to (different layout)" % path)
+        self.stride = self.dtype.itemsize * self.nRecLength  # bytes per record
+        self.mm = None  # memmap over the records, remapped when records were added
+        self.f = None
+        if mode == 'r':
+            self.nRecords = (os.path.getsize(path) - self.HEADER_SIZE) // self.stride
+            return
+        self.f = open(path, 'w+b' if bNew else 'r+b')
+        self.nRecords = 0 if bNew else (os.path.getsize(path) - self.HEADER_SIZE) // self.stride
+        self.f.truncate(self.HEADER_SIZE + self.nRecords * self.stride)
+        self.writeheader()
+        self.f.seek(0, os.SEEK_END)
+
+    def readheader(self, f):
+        header = f.read(self.HEADER_SIZE)
+        if not header.startswith(self.MAGIC):
+            raise ValueError("%s is not a waveform archive" % self.path)
+        return json.loads(header[len(self.MAGIC):].decode('utf-8'))
+
+    def info(self):
+        # header values: layout, settings and number of records
+        info = {'dtype': self.dtype.str, 'nRecLength': self.nRecLength, 'nRecords': self.nRecords}
+        info.update(self.settings)
+        return info
+
+    def writeheader(self):
+        header = json.dumps(self.info(), default=lambda x: x.tolist()).encode('utf-8')
+        if len(self.MAGIC) + len(header) >= self.HEADER_SIZE:
+            raise ValueError("Settings do not fit in the header of %s" % self.path)
+        self.f.seek(0)
+        self.f.write(self.MAGIC + header.ljust(self.HEADER_SIZE - len(self.MAGIC) - 1) + b'\n')
+
+    def __len__(self):
+        return self.nRecords
+
+    def __getitem__(self, key):
+        return self.records()[key]
+
+    def records(self, i0=0, i1=None):
+        # records i0 to i1 (records x samples), a read-only view of the file
+        if self.mm is None or len(self.mm) != self.nRecords:
+            if self.f is not None:
+                self.f.flush()
+            if self.nRecords == 0:
+                return np.zeros((0, self.nRecLength), dtype=self.dtype)
+            self.mm = np.memmap(self.path, dtype=self.dtype, mode='r', offset=self.HEADER_SIZE,
+                                shape=(self.nRecords, self.nRecLength))
+        return self.mm[i0:i1]
+
+    def timevec(self):
+        # time vector of the records, as DWF.getsig2 returns it
+        nSampFreq = self.settings['nSampFreq']
+        return np.arange(0, self.nRecLength / nSampFreq, 1 / nSampFreq)[:self.nRecLength]
+
+    def append(self, records):
+        records = np.ascontiguousarray(records, dtype=self.dtype).reshape(-1, self.nRecLength)
+        self.f.write(records.tobytes())
+        self.nRecords += len(records)
+
+    def flush(self):
+        if self.f is not None:
+            self.writeheader()
+            self.f.seek(0, os.SEEK_END)
+            self.f.flush()
+
+    def close(self):
+        self.mm = None
+        if self.f is not None and not self.f.closed:
+            self.flush()
+            self.f.close()
+
+
+class NpyStore(object):
+    # Data_<label>.npy holds the results as a structured array with one field per column of DATA_COLUMNS,
+    # Signal_<label>.npy the signals as a 2-D array (records x samples).
+    DATA_SUFFIX = '.npy'  # of the results file, one per backend so their rows always match their own signals
+
+    def __init__(self, label, dtype='float64', info=None):
+        self.label = label
+        self.dtype = np.dtype(dtype)
+        self.info = info or {}  # acquisition settings of the signals (WaveArchive.SETTINGS)
+        self.data = NpyAppender('Data_' + label + self.DATA_SUFFIX, DATA_DTYPE)
+        self.signal = None  # opened on the first record, when the signal length is known
+
+    def opensignal(self, nRecLength):
+        return NpyAppender('Signal_' + self.label + '.npy', self.dtype, (nRecLength,))
+
+    def append(self, data, signal):
+        signal = np.asarray(signal)
+        if self.signal is None:
+            self.signal = self.opensignal(len(signal))
+        self.data.append(np.array(tuple(data), dtype=DATA_DTYPE))
+        self.signal.append(signal)
+
+    def flush(self):
+        self.data.flush()
+        if self.signal is not None:
+            self.signal.flush()
+
+    def close(self):
+        self.data.close()
+        if self.signal is not None:
+            self.signal.close()
+
+
+class WaveStore(NpyStore):
+    # As NpyStore, with the signals in the waveform archive Signal_<label>.wfa, its header holding the settings in info,
+    # and the results in Data_<label>.wfa.npy.
+    DATA_SUFFIX = '.wfa.npy'
+
+    def opensignal(self, nRecLength):
+        return WaveArchive('Signal_' + self.label + '.wfa', 'a', nRecLength, self.dtype, **self.info)
+
+
+class Hdf5Store(object):
+    # <label>.h5 holds one 1-D dataset per column of DATA_COLUMNS in the group 'data' and the signals in the 2-D
+    # dataset 'signal' (records x samples), all chunked and resizable along the records. The settings in info are kept
+    # as attributes of the file.
+
+    def __init__(self, label, dtype='float64', info=None, nChunk=64):
+        if h5py is None:
+            raise ImportError("h5py is required for the 'hdf5' storage backend")
+        self.label = label
+        self.dtype = np.dtype(dtype)
+        self.nChunk = nChunk  # records per chunk of the signal dataset
+        self.f = h5py.File(label + '.h5', 'a')
+        for name, value in (info or {}).items():
+            self.f.attrs[name] = value
+        group = self.f.require_group('data')
+        for name in DATA_COLUMNS:
+            if name not in group:
+                group.create_dataset(name, shape=(0,), maxshape=(None,), dtype='f8', chunks=(1024,))
+
+    def append(self, data, signal):
+        signal = np.asarray(signal)
+        if 'signal' not in self.f:
+            self.f.create_dataset('signal', shape=(0, len(signal)), maxshape=(None, len(signal)), dtype=self.dtype,
+                                  chunks=(self.nChunk, len(signal)))
+        for name, value in zip(DATA_COLUMNS, data):
+            column = self.f['data'][name]
+            column.resize((column.shape[0] + 1,))
+            column[-1] = value
+        dataset = self.f['signal']
+        dataset.resize((dataset.shape[0] + 1, dataset.shape[1]))
+        dataset[-1] = signal
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        if self.f:
+            self.f.close()
+
+
+class CsvStore(object):
+    # Data_<label>.csv and Signal_<label>.csv, one line per record as written before the binary backends,
+    # the files are kept open between records.
+
+    def __init__(self, label, dtype='float64', info=None):
+        self.label = label
+        self.fData = open('Data_' + label + '.csv', 'a')
+        self.fSignal = open('Signal_' + label + '.csv', 'a')
+
+    def append(self, data, signal):
+        np.savetxt(self.fData, np.reshape(np.asarray(data, dtype=float), (1, -1)), fmt=DATA_FMT, delimiter=',')
+        np.savetxt(self.fSignal, [signal], delimiter=',')
+
+    def flush(self):
+        self.fData.flush()
+        self.fSignal.flush()
+
+    def close(self):
+        self.fData.close()
+        self.fSignal.close()
+
+
+STORES = {'wfa': WaveStore, 'npy': NpyStore, 'hdf5': Hdf5Store, 'csv': CsvStore}
+
+# to open the store of a backend ('wfa', 'npy', 'hdf5' or 'csv') for a file label, in the current directory
+# info holds the acquisition settings of the signals (WaveArchive.SETTINGS), kept by the 'wfa' and 'hdf5' backends
+def openstore(label, backend='npy', dtype='float64', info=None):
+    if backend not in STORES:
+        raise ValueError("Unknown storage backend '%s'" % backend)
+    return STORES[backend](label, dtype, info)
+
+class StoreWriter(object):
+    # Writes records to their stores in a background thread, so the acquisition loop does not wait for the disk.
+    # Records go through a queue of at most nQueue entries; when it is full, put() waits for space (policy 'block')
+    # or discards the record (policy 'drop'). The thread writes whatever is queued and flushes the stores every nBatch
+    # records or when the queue runs empty. stop() writes the remaining records and closes the stores.
+
+    def __init__(self, backend='npy', dtype='float64', nQueue=256, nBatch=16, policy='block'):
+        if policy not in ('block', 'drop'):
+            raise ValueError("Unknown queue policy '%s'" % policy)
+        self.backend = backend
+        self.dtype = dtype
+        self.nBatch = nBatch  # records written between flushes at most
+        self.policy = policy
+        self.queue = queue.Queue(nQueue)
+        self.stores = {}  # open stores by label, only used by the writer thread
+        self.error = None  # last exception raised in the writer thread
+        self.thread = None
+        self.lock = threading.Lock()
+        self.nPut = 0  # records accepted
+        self.nDropped = 0  # records discarded because the queue was full
+        self.nWritten = 0  # records written
+        self.nFlush = 0  # number of flushes
+        self.nDepthMax = 0  # largest queue depth after a put()
+        self.tBlocked = 0.0  # total time put() waited for space, in seconds
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self.run, args=(), daemon=True)
+        self.thread.start()
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def put(self, label, data, signal, info=None):
+        # queue one record, returns False if it was dropped
+        try:
+            self.queue.put_nowait((label, data, signal, info))
+        except queue.Full:
+            if self.policy == 'drop':
+                with self.lock:
+                    self.nDropped += 1
+                return False
+            tStart = time.monotonic()
+            self.queue.put((label, data, signal, info))
+            with self.lock:
+                self.tBlocked += time.monotonic() - tStart
+        with self.lock:
+            self.nPut += 1
+            self.nDepthMax = max(self.nDepthMax, self.queue.qsize())
+        return True
+
+    def run(self):
+        nPending = 0  # records written since the last flush
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                label, data, signal, info = item
+                if label not in self.stores:
+                    self.stores[label] = openstore(label, self.backend, self.dtype, info)
+                self.stores[label].append(data, signal)
+                nPending += 1
+                with self.lock:
+                    self.nWritten += 1
+                if nPending >= self.nBatch or self.queue.empty():
+                    self.flush()
+                    nPending = 0
+            except Exception as e:
+                print("Error saving data:", e)
+                self.error = e
+        self.flush()
+        for store in self.stores.values():
+            store.close()
+        self.stores = {}
+
+    def flush(self):
+        for store in self.stores.values():
+            store.flush()
+        with self.lock:
+            self.nFlush += 1
+
+    def stop(self):
+        # write the queued records, close the stores and end the thread
+        if self.running():
+            self.queue.put(None)
+            self.thread.join()
+        self.thread = None
+
+    def stats(self):
+        with self.lock:
+            return {'queued': self.queue.qsize(),
+                    'depth_max': self.nDepthMax,
+                    'put': self.nPut,
+                    'dropped': self.nDropped,
+                    'written': self.nWritten,
+                    'flushes': self.nFlush,
+                    'blocked': self.tBlocked}
+
+# signal file of each backend, in the order they are looked for
+SIGNAL_FILES = (('wfa', 'Signal_%s.wfa'), ('npy', 'Signal_%s.npy'), ('hdf5', '%s.h5'), ('csv', 'Signal_%s.csv'))
+
+# to find the backend of the store saved for a file label in the current directory
+def findbackend(label):
+    for backend, name in SIGNAL_FILES:
+        if os.path.isfile(name % label):
+            return backend
+    raise FileNotFoundError("No store found for '%s' (%s)" % (label, ', '.join(name % label for _, name in SIGNAL_FILES)))
+
+# to load a store, returns the results as a dict of columns and the signals as a 2-D array
+# backend None for the one whose files are found (see findbackend)
+def loadstore(label, backend=None):
+    if backend is None:
+        backend = findbackend(label)
+    if backend in ('npy', 'wfa'):
+        data = np.load('Data_' + label + STORES[backend].DATA_SUFFIX)
+        if backend == 'wfa':
+            signal = WaveArchive('Signal_' + label + '.wfa').records()
+        else:
+            signal = np.load('Signal_' + label + '.npy', mmap_mode='r')
+        return {name: data[name] for name in DATA_COLUMNS}, signal
+    if backend == 'hdf5':
+        if h5py is None:
+            raise ImportError("h5py is required for the 'hdf5' storage backend")
+        with h5py.File(label + '.h5', 'r') as f:
+            return {name: f['data'][name][:] for name in DATA_COLUMNS}, f['signal'][:]
+    if backend == 'csv':
+        data = np.loadtxt('Data_' + label + '.csv', delimiter=',', ndmin=2)
+        signal = np.loadtxt('Signal_' + label + '.csv', delimiter=',', ndmin=2)
+        return {name: data[:, i] for i, name in enumerate(DATA_COLUMNS)}, signal
+    raise ValueError("Unknown storage backend '%s'" % backend)
+
+# to export a binary store to Data_<label>.csv and Signal_<label>.csv (replacing them if they exist)
+# backend None for the one whose files are found (see findbackend)
+def export_csv(label, backend=None, nChunk=256):
+    if backend is None:
+        backend = findbackend(label)
+    if backend == 'csv':
+        print("Data_%s.csv and Signal_%s.csv are already CSV files" % (label, label))
+        return
+    data, signal = loadstore(label, backend)
+    with open('Data_' + label + '.csv', 'w') as fData:
+        np.savetxt(fData, np.column_stack([data[name] for name in DATA_COLUMNS]), fmt=DATA_FMT, delimiter=',')
+    with open('Signal_' + label + '.csv', 'w') as fSignal:
+        # in chunks, the signals may not fit in memory as text
+        for i in range(0, len(signal), nChunk):
+            np.savetxt(fSignal, np.asarray(signal[i:i + nChunk]), delimiter=',')
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m dwflib.storage <label> [wfa|npy|hdf5]  (default: the backend whose files are found)")
+        sys.exit(1)
+    export_csv(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Columnar store for the rows shown in the data table of the GUI.
+    Author:  Jinrui Huang
+    Revision:  16-10-2026
+    Requires:  Python 3.5
+
+"""
+
+import numpy as np
+
+class ColumnStore(object):
+    # Rows of float values kept column by column in preallocated NumPy arrays, appended in batches. With nMax set only
+    # the last nMax rows are kept, older rows are dropped from the front, so memory stays the same however many rows
+    # are appended. Rows are stored between i0 and i0+nRows, the arrays are compacted or grown when the end is reached.
+
+    def __init__(self, columns, nMax=None, nCapacity=1024):
+        self.columns = list(columns)
+        self.nColumns = len(self.columns)
+        self.nMax = nMax  # rows kept at most, None for no limit
+        if nMax is not None:
+            nCapacity = 2 * nMax
+        self.data = np.zeros((self.nColumns, nCapacity))
+        self.i0 = 0  # first row in data
+        self.nRows = 0
+
+    def __len__(self):
+        return self.nRows
+
+    def append(self, rows):
+        # append rows (n x nColumns), dropping the oldest rows beyond nMax
+        rows = np.asarray(rows, dtype=float).reshape(-1, self.nColumns)
+        if self.nMax is not None:
+            rows = rows[-self.nMax:]
+            self.drop(self.nRows + len(rows) - self.nMax)
+        if self.i0 + self.nRows + len(rows) > self.data.shape[1]:
+            nCapacity = self.data.shape[1]
+            if self.nMax is None:
+                nCapacity = max(2 * nCapacity, self.nRows + len(rows))
+            data = np.zeros((self.nColumns, nCapacity))
+            data[:, :self.nRows] = self.data[:, self.i0:self.i0 + self.nRows]
+            self.data = data
+            self.i0 = 0
+        self.data[:, self.i0 + self.nRows:self.i0 + self.nRows + len(rows)] = rows.T
+        self.nRows += len(rows)
+
+    def drop(self, n):
+        # remove the n oldest rows
+        n = min(max(n, 0), self.nRows)
+        self.i0 += n
+        self.nRows -= n
+        if self.nRows == 0:
+            self.i0 = 0
+
+    def clear(self):
+        self.drop(self.nRows)
+
+    def column(self, name):
+        # view of a column, valid until the next append
+        i = self.columns.index(name)
+        return self.data[i, self.i0:self.i0 + self.nRows]
+
+    def value(self, row, col):
+        return self.data[col, self.i0 + row]
@@ -0,0 +1,37 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Functions for building the excitation waveforms loaded into the AD2 waveform generator.
+    Author:  Jinrui Huang
+    Revision:  16-10-2026
+    Requires:  Python 3.5
+
+"""
+
+from functools import lru_cache
+import numpy as np
+
+# to get a tone-burst of nCycles at nFreq sampled at nSampFreq, with nLag zero samples before and after the pulse
+# shape is 'hann' (Hann-windowed sine, the default), 'gauss' (Gaussian envelope, +-3 sigma over the pulse)
+# or 'chirp' (Hann-windowed linear sweep over +-bandwidth/2 around nFreq)
+# values are within +-1, bursts are cached and the returned array is read-only as it is shared between callers
+@lru_cache(maxsize=32)
+def toneburst(nSampFreq, nFreq, nCycles, nLag, shape='hann', bandwidth=0.5):
+    nPulse = int(nSampFreq * nCycles / nFreq)
+    i = np.arange(nPulse, dtype=float)
+    if shape == 'hann':
+        Pulse = np.sin(1.0 * i / nPulse * nCycles * 2 * np.pi) * 0.5 * (1 - np.cos(2 * np.pi * 1.0 * i / (nPulse - 1)))
+    elif shape == 'gauss':
+        Pulse = np.sin(1.0 * i / nPulse * nCycles * 2 * np.pi) * np.exp(-0.5 * ((i - (nPulse - 1) / 2) / (nPulse / 6)) ** 2)
+    elif shape == 'chirp':
+        # phase of a sweep from (1-bandwidth/2)*nFreq to (1+bandwidth/2)*nFreq, in cycles of nFreq
+        x = i / nPulse
+        phase = nCycles * ((1 - bandwidth / 2) * x + bandwidth / 2 * x ** 2)
+        Pulse = np.sin(2 * np.pi * phase) * 0.5 * (1 - np.cos(2 * np.pi * 1.0 * i / (nPulse - 1)))
+    else:
+        raise ValueError("Unknown tone-burst shape '%s'" % shape)
+    Pulse /= max(np.max(np.abs(Pulse)), 1.0)
+    rgdSamples = np.zeros(nPulse + 2 * nLag)
+    rgdSamples[nLag:nLag + nPulse] = Pulse
+    rgdSamples.flags.writeable = False
+    return rgdSamples
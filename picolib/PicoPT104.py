@@ -9,9 +9,12 @@
 """
 
 import ctypes
-from picosdk.usbPT104 import usbPt104 as pt104
+from picolib.drivers import register, load_pico
 import time
 
+# PicoSDK usbPT104 library, loaded on first use
+pt104 = register('usbpt104', load_pico('usbPt104'), 'picosdk.usbPT104')
+
 class PT104(object):
     
     def __init__(self):
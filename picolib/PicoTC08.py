@@ -5,7 +5,10 @@
 
 
 import ctypes
-from picosdk.usbtc08 import usbtc08 as tc08
+from picolib.drivers import register, load_pico
+
+# PicoSDK usbtc08 library, loaded on first use
+tc08 = register('usbtc08', load_pico('usbtc08'), 'picosdk.usbtc08')
 
 class PicoTC08(object):
     
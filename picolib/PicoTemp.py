@@ -0,0 +1,193 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+   Python module for long-lived temperature logger sessions (Pico PT104, with Pico TC08 as fallback).
+   Author:  Jinrui Huang
+   Revision:  16-10-2026
+   Requires:  Python 3.5, Pico SDK
+
+"""
+
+import time
+import threading
+import numpy as np
+from picosdk.constants import PICO_STATUS
+from picolib.PicoPT104 import PT104
+from picolib.PicoTC08 import PicoTC08
+
+class TempSession(object):
+    # Keeps the temperature loggers open between readings: the PT104 channel is configured once when the unit is
+    # opened (which waits for the first conversion), after that every reading only fetches the latest converted value.
+    # The TC08 is only opened if the PT104 reads zero. A unit is closed after a failed call and re-opened on the next
+    # reading. The last reading is kept with its time so callers can reuse recent values.
+
+    def __init__(self, PicoSN, nPT=1, typePT=1, tPT=2, tc08cn=1, tc08tp='typeT'):
+        self.PicoSN = PicoSN  # serial number of the pt104
+        self.nPT = nPT  # pt104 channel
+        self.typePT = typePT  # pt104 sensor type, 1 for PT100
+        self.tPT = tPT  # time for the first pt104 conversion in seconds
+        self.tc08cn = tc08cn  # tc08 channel
+        self.tc08tp = tc08tp  # tc08 thermocouple type
+        self.pt104 = None  # open PT104, None if closed
+        self.tc08 = None  # open PicoTC08, None if closed
+        self.temp = 0  # last reading
+        self.tRead = None  # time.monotonic() of the last reading
+        self.nOpen = 0  # number of times a unit was (re-)opened
+        self.lock = threading.Lock()
+
+    def openpt104(self):
+        pt104 = PT104()
+        pt104.openunit(self.PicoSN)
+        if pt104.status != PICO_STATUS['PICO_OK'] or pt104.handle.value <= 0:
+            raise IOError("PT104 %s not opened (status %s)" % (self.PicoSN, pt104.status))
+        pt104.setmain()
+        pt104.setchannel(self.nPT, self.typePT, 4, self.tPT)
+        self.pt104 = pt104
+        self.nOpen += 1
+
+    def opentc08(self):
+        tc08 = PicoTC08()
+        tc08.openunit(self.tc08cn, self.tc08tp)
+        if tc08.handle <= 0:
+            raise IOError("TC08 not opened")
+        self.tc08 = tc08
+        self.nOpen += 1
+
+    def closept104(self):
+        if self.pt104 is not None:
+            try:
+                self.pt104.closeunit()
+            except Exception:
+                pass
+            self.pt104 = None
+
+    def closetc08(self):
+        if self.tc08 is not None:
+            try:
+                self.tc08.closeunit()
+            except Exception:
+                pass
+            self.tc08 = None
+
+    def readpt104(self):
+        try:
+            if self.pt104 is None:
+                self.openpt104()
+            temp = self.pt104.getvalue(self.nPT)
+            if self.pt104.status == PICO_STATUS['PICO_NO_SAMPLES_AVAILABLE']:
+                # conversion not finished yet, the unit itself is fine
+                return 0
+            if self.pt104.status != PICO_STATUS['PICO_OK']:
+                raise IOError("PT104 reading failed (status %s)" % self.pt104.status)
+            return temp
+        except Exception:
+            self.closept104()
+            return 0
+
+    def readtc08(self):
+        try:
+            if self.tc08 is None:
+                self.opentc08()
+            temp = self.tc08.getvalue(self.tc08cn)
+            if self.tc08.status["get_single"] == 0:
+                raise IOError("TC08 reading failed")
+            return temp
+        except Exception:
+            self.closetc08()
+            return 0
+
+    def read(self):
+        # get a new reading from the pt104, or from the tc08 if the pt104 reads zero, 0 if neither works
+        with self.lock:
+            temp = self.readpt104()
+            if temp == 0:
+                temp = self.readtc08()
+            self.temp = temp
+            self.tRead = time.monotonic()
+            return temp
+
+    def cached(self):
+        # last reading and its age in seconds (age is None if there was no reading yet)
+        with self.lock:
+            if self.tRead is None:
+                return self.temp, None
+            return self.temp, time.monotonic() - self.tRead
+
+    def get(self, maxage=0):
+        # last reading if it is younger than maxage seconds, otherwise a new reading
+        temp, age = self.cached()
+        if age is not None and age < maxage:
+            return temp
+        return self.read()
+
+    def close(self):
+        with self.lock:
+            self.closept104()
+            self.closetc08()
+
+
+class TempSampler(object):
+    # Reads a TempSession in a background thread every tInterval seconds and keeps the last nBuffer readings with their
+    # time.monotonic() stamps in a ring buffer, so acquisition code can look up the temperature at any recent time
+    # without talking to the loggers itself. Zero readings (no logger available) are not stored.
+
+    def __init__(self, session, tInterval=1.0, nBuffer=3600):
+        self.session = session
+        self.tInterval = tInterval  # time between readings in seconds
+        self.times = np.zeros(nBuffer)  # ring buffer of reading times
+        self.values = np.zeros(nBuffer)  # ring buffer of readings
+        self.nWrite = 0  # number of readings stored so far, the next one goes to nWrite % nBuffer
+        self.lock = threading.Lock()
+        self.ready = threading.Event()  # set once the first reading is stored
+        self.tried = threading.Event()  # set once the first reading was attempted, whether a logger answered or not
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, args=(), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join()
+        self.thread = None
+
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def run(self):
+        while not self.stopped.is_set():
+            temp = self.session.read()
+            if temp != 0:
+                self.append(time.monotonic(), temp)
+            self.tried.set()
+            self.stopped.wait(self.tInterval)
+
+    def append(self, t, temp):
+        with self.lock:
+            i = self.nWrite % len(self.times)
+            self.times[i] = t
+            self.values[i] = temp
+            self.nWrite += 1
+        self.ready.set()
+
+    def history(self):
+        # stored (times, readings) in time order
+        with self.lock:
+            n = min(self.nWrite, len(self.times))
+            i = self.nWrite % len(self.times)
+            if self.nWrite <= len(self.times):
+                return self.times[:n].copy(), self.values[:n].copy()
+            return np.roll(self.times, -i), np.roll(self.values, -i)
+
+    def at(self, t):
+        # temperature at time t (time.monotonic()), linearly interpolated between readings and held at the first/last
+        # reading outside the stored range, 0 if there is no reading yet
+        times, values = self.history()
+        if len(times) == 0:
+            return 0
+        return float(np.interp(t, times, values))
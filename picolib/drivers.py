@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+    Registry of driver libraries loaded on first use, with import and load times. The modules using a library
+    register it (e.g. dwflib.DWF the WaveForms library, picolib.PicoPT104 the PicoSDK usbPT104 library).
+    Author:  Jinrui Huang
+    Revision:  17-10-2026
+    Requires:  Python 3.5
+    Usage:  pt104 = register('usbpt104', load_pico('usbPt104'), 'picosdk.usbPT104'); pt104.UsbPt104OpenUnit(...); print(stats())
+
+"""
+
+import time
+import threading
+import importlib
+
+class DriverError(OSError):
+    # a driver library that could not be imported or loaded
+    pass
+
+class Driver(object):
+    # A driver library that is only loaded when one of its functions is first used. The loader returns the library
+    # object (a ctypes library or a picosdk Library). If a wrapper module is given it is imported first, the time it
+    # takes is kept in tImport, the time the library takes to load in tLoad. A failed load is remembered and raised
+    # again as DriverError on every use, without trying again until reset(). Functions are looked up on the library
+    # once and then kept on the Driver, so repeated calls cost the same as calling the library directly.
+
+    def __init__(self, name, loader, module=None):
+        self.name = name
+        self.loader = loader  # called with the imported module (or None) to get the library object
+        self.module = module  # wrapper module to import first, None for none
+        self.lib = None
+        self.error = None  # DriverError of the failed load, None if not tried or loaded
+        self.tImport = None  # time to import the wrapper module in seconds
+        self.tLoad = None  # time to load the library in seconds
+        self.lock = threading.Lock()
+
+    def load(self):
+        # the library, loaded on the first call
+        if self.lib is not None:
+            return self.lib
+        with self.lock:
+            if self.lib is None:
+                if self.error is not None:
+                    raise self.error
+                try:
+                    module = None
+                    if self.module is not None:
+                        tic = time.perf_counter()
+                        module = importlib.import_module(self.module)
+                        self.tImport = time.perf_counter() - tic
+                    tic = time.perf_counter()
+                    lib = self.loader(module)
+                    self.tLoad = time.perf_counter() - tic
+                except Exception as e:
+                    self.error = DriverError("%s driver not available: %s" % (self.name, e))
+                    raise self.error
+                self.lib = lib
+        return self.lib
+
+    def available(self):
+        # True if the library is loaded or can be loaded
+        try:
+            self.load()
+            return True
+        except DriverError:
+            return False
+
+    def loaded(self):
+        return self.lib is not None
+
+    def reset(self):
+        # forget a failed load, e.g. after the SDK was installed
+        with self.lock:
+            self.error = None
+
+    def __getattr__(self, name):
+        # functions of the library, loaded on first use
+        if name.startswith('__'):
+            raise AttributeError(name)
+        attr = getattr(self.load(), name)
+        setattr(self, name, attr)
+        return attr
+
+    def __str__(self):
+        return "%s driver" % self.name
+
+# registered drivers by name
+DRIVERS = {}
+
+def register(name, loader, module=None):
+    # add a driver to the registry (replacing one of the same name), returns the Driver
+    DRIVERS[name] = Driver(name, loader, module)
+    return DRIVERS[name]
+
+def driver(name):
+    return DRIVERS[name]
+
+def stats():
+    # load state and times of the registered drivers, by name
+    return {name: {'loaded': d.loaded(), 'error': str(d.error) if d.error is not None else None,
+                   'import_s': d.tImport, 'load_s': d.tLoad}
+            for name, d in DRIVERS.items()}
+
+# PicoSDK wrapper modules, the Library instance is taken from the module and its shared library loaded
+def load_pico(attr):
+    def loader(module):
+        lib = getattr(module, attr)
+        lib.load()
+        return lib
+    return loader
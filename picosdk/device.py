@@ -49,25 +49,61 @@ _TIMEBASE_OPTIONS_DEFAULTS = (None, None, None, 1)
 TimebaseOptions.__new__.__defaults__ = _TIMEBASE_OPTIONS_DEFAULTS
 
 
+"""StreamingChunk: A type for the data yielded by Device.capture_streaming
+start_index = the position of the first sample of the chunk in the stream (0 for the first sample captured).
+times = sample times in seconds from the start of the stream.
+voltages = a dict of channel name to float32 array of voltages.
+overflow_warnings = a dict of channel names which went over range in this chunk, to True.
+sample_rate = samples per second received from the device so far, measured with the wall clock.
+overruns = how many times the driver was seen to skip samples so far, because the stream was not read quickly enough.
+    This is a best-effort lower bound: only jumps in the driver's start index are seen, losses which leave the index
+    where it was expected (e.g. a whole buffer's worth) are not. Compare sample_rate to 1 / (times[1] - times[0])
+    to check that the stream keeps up."""
+StreamingChunk = collections.namedtuple('StreamingChunk', ['start_index',
+                                                           'times',
+                                                           'voltages',
+                                                           'overflow_warnings',
+                                                           'sample_rate',
+                                                           'overruns'])
+
+
+# largest timebase id the drivers accept (uint32).
+_MAX_TIMEBASE_ID = 2**32 - 1
+
+
 class Device(object):
     """This object caches some information about the device state which cannot be queried from the driver. Please don't
     mix and match calls to this object with calls directly to the driver (or the ctypes wrapper), as this may cause
     unwanted behaviour (e.g. throwing an exception because no channels are enabled, when you enabled them yourself
     on the driver object.)"""
-    def __init__(self, driver, handle):
+    def __init__(self, driver, handle, resolution=None):
         self.driver = driver
         self.handle = handle
         self.is_open = handle > 0
+        # resolution the device was opened with or set to (a driver constant), None for fixed resolution devices.
+        self.resolution = resolution
 
         # if a channel is missing from here, it is disabled (or in an undefined state).
         self._channel_ranges = {}
         self._channel_offsets = {}
 
+        # number of memory segments set on the device, None if not set by this object.
+        self._memory_segments = None
+        # timebases found by find_timebase, keyed by resolution, enabled channels, memory segments and the
+        # TimebaseOptions, so repeated captures with the same settings skip the search. Cleared when the device is
+        # closed or its resolution changed.
+        self._timebase_cache = {}
+
+        # raw sample buffers of rapid block captures (channel name to a captures x samples int16 array), kept between
+        # captures of the same shape so the driver writes into the same memory every time.
+        self._bulk_buffers = {}
+
     @requires_open("The device either did not initialise correctly or has already been closed.")
     def close(self):
         self.driver.close_unit(self)
         self.handle = None
         self.is_open = False
+        self._timebase_cache.clear()
 
     @property
     @requires_open()
@@ -106,6 +142,14 @@ class Device(object):
         self._channel_offsets[name] = channel_config.analog_offset
         return self._channel_ranges[name]
 
+    @requires_open()
+    def set_resolution(self, resolution):
+        """set the resolution of a flexible resolution device (a constant from the driver module, e.g.
+        ps5000a.PS5000A_DEVICE_RESOLUTION["PS5000A_DR_12BIT"].) The available timebases change with it."""
+        self.driver.set_device_resolution(self, resolution)
+        self.resolution = resolution
+        self._timebase_cache.clear()
+
     @requires_open()
     def set_channels(self, *channel_configs):
         """ set_channels(self, *channel_configs)
@@ -155,31 +199,90 @@ class Device(object):
                 return False
         return True
 
+    def _timebase_cache_key(self, timebase_options):
+        # the options include oversample.
+        return (self.resolution,
+                tuple(sorted(self._channel_ranges.keys())),
+                self._memory_segments,
+                timebase_options)
+
     @requires_open()
     def find_timebase(self, timebase_options):
-        timebase_id = 0
+        """find the fastest timebase which meets the options. The result is remembered for this device's resolution,
+        enabled channels and number of memory segments, later calls with the same options do not ask the driver."""
         # quickly validate that the request is not impossible.
         if self._timebase_options_are_impossible(timebase_options):
             raise NoValidTimebaseForOptionsError()
-        # TODO binary search?
-        last_error = None
-        found_one_good = False
-        while True:
+        key = self._timebase_cache_key(timebase_options)
+        if key not in self._timebase_cache:
+            self._timebase_cache[key] = self._search_timebase(timebase_options)
+        return self._timebase_cache[key]
+
+    def _search_timebase(self, timebase_options):
+        """The time interval grows with the timebase id, so the options split into those which only hold below some id
+        (max_time_interval) and those which only hold above some id (no_of_samples, min_collection_time). The lowest
+        id meeting the second kind is found by an exponential search, then a binary search, from the first timebase
+        the driver accepts; the ids past the last one it accepts count as meeting them, as the search ends there."""
+        last_error = []
+        long_options = timebase_options._replace(max_time_interval=None)
+        fast_options = TimebaseOptions(max_time_interval=timebase_options.max_time_interval)
+
+        def get_timebase(timebase_id):
             try:
-                timebase_info = self.driver.get_timebase(self, timebase_id, 0, timebase_options.oversample)
-                found_one_good = True
-                if self._validate_timebase(timebase_options, timebase_info):
-                    return timebase_info
+                return self.driver.get_timebase(self, timebase_id, 0, timebase_options.oversample)
             except InvalidTimebaseError as e:
-                if found_one_good:
-                    # we won't find a valid timebase.
-                    last_error = e
-                    break
-            timebase_id += 1
-        args = ()
-        if last_error is not None:
-            args = (last_error.args[0],)
-        raise NoValidTimebaseForOptionsError(*args)
+                last_error[:] = [e]
+                return None
+
+        def long_enough(timebase_info):
+            return timebase_info is None or self._validate_timebase(long_options, timebase_info)
+
+        def no_valid_timebase():
+            args = ()
+            if last_error:
+                args = (last_error[0].args[0],) if last_error[0].args else ()
+            return NoValidTimebaseForOptionsError(*args)
+
+        # the fastest timebases may not be available with these settings.
+        low_id = 0
+        low_info = get_timebase(low_id)
+        while low_info is None:
+            if low_id == _MAX_TIMEBASE_ID:
+                raise no_valid_timebase()
+            low_id += 1
+            low_info = get_timebase(low_id)
+        if long_enough(low_info):
+            if self._validate_timebase(timebase_options, low_info):
+                return low_info
+            raise no_valid_timebase()
+
+        # exponential search for a timebase which is long enough, low_id is not.
+        step = 1
+        while True:
+            if not self._validate_timebase(fast_options, low_info):
+                # the time interval is already too long, and only grows from here.
+                raise no_valid_timebase()
+            high_id = min(low_id + step, _MAX_TIMEBASE_ID)
+            high_info = get_timebase(high_id)
+            if long_enough(high_info):
+                break
+            if high_id == _MAX_TIMEBASE_ID:
+                raise no_valid_timebase()
+            low_id, low_info = high_id, high_info
+            step *= 2
+
+        # binary search for the lowest one between low_id and high_id.
+        while high_id - low_id > 1:
+            mid_id = (low_id + high_id) // 2
+            mid_info = get_timebase(mid_id)
+            if long_enough(mid_info):
+                high_id, high_info = mid_id, mid_info
+            else:
+                low_id, low_info = mid_id, mid_info
+
+        if high_info is None or not self._validate_timebase(timebase_options, high_info):
+            raise no_valid_timebase()
+        return high_info
 
     @requires_open()
     def capture_block(self, timebase_options, channel_configs=()):
@@ -201,6 +304,7 @@ class Device(object):
             # always force the number of memory segments on the device to 1 before computing timebases for a one-off
             # block capture.
             max_samples_possible = self.driver.memory_segments(self, USE_SEGMENT_ID+1)
+            self._memory_segments = USE_SEGMENT_ID+1
             if timebase_options.no_of_samples is not None and timebase_options.no_of_samples > max_samples_possible:
                 raise NoValidTimebaseForOptionsError()
         except DeviceCannotSegmentMemoryError:
@@ -252,3 +356,208 @@ class Device(object):
             voltages[channel] = array
 
         return times, voltages, overflow_warnings
+
+    @requires_open()
+    def capture_rapid_block(self, timebase_options, number_captures, channel_configs=(), null_trigger=True):
+        """device.capture_rapid_block(timebase_options, number_captures, channel_configs)
+        Captures number_captures blocks in one run (rapid block mode): the device memory is split into one segment per
+        capture and the device re-arms itself after each trigger, then all segments are read at once.
+        timebase_options: TimebaseOptions object, specifying at least 1 constraint, and optionally oversample.
+        number_captures: number of blocks to capture.
+        channel_configs: a collection of ChannelConfig objects. If present, will be passed to set_channels.
+        null_trigger: if True, each block is captured straight away (as in capture_block). Set it to False to keep the
+            trigger configured on the driver.
+        returns: times, a dict of channel name to a (number_captures x samples) float32 array of voltages, an array of
+            trigger time offsets in seconds (None if the driver cannot report them), and a dict of channel names
+            which went over range to a boolean array with one value per capture.
+        """
+        if channel_configs:
+            self.set_channels(*channel_configs)
+
+        if len(self._channel_ranges) == 0:
+            raise NoChannelsEnabledError("We cannot capture any data if no channels are enabled.")
+
+        # memory_segments: one per capture (raises DeviceCannotSegmentMemoryError if the device cannot segment it.)
+        max_samples_possible = self.driver.memory_segments(self, number_captures)
+        self._memory_segments = number_captures
+        max_samples_possible = getattr(max_samples_possible, 'value', max_samples_possible)
+        if timebase_options.no_of_samples is not None and timebase_options.no_of_samples > max_samples_possible:
+            raise NoValidTimebaseForOptionsError()
+
+        # get_timebase
+        timebase_info = self.find_timebase(timebase_options)
+
+        post_trigger_samples = timebase_options.no_of_samples
+        pre_trigger_samples = 0
+
+        if post_trigger_samples is None:
+            post_trigger_samples = int(math.ceil(timebase_options.min_collection_time / timebase_info.time_interval))
+
+        channels = list(self._channel_ranges.keys())
+        shape = (number_captures, post_trigger_samples)
+        for channel in channels:
+            if channel not in self._bulk_buffers or self._bulk_buffers[channel].shape != shape:
+                self._bulk_buffers[channel] = numpy.zeros(shape, numpy.dtype('int16'))
+            for segment_index in range(number_captures):
+                self.driver.set_data_buffer(self, channel, self._bulk_buffers[channel][segment_index],
+                                            segment_index, bulk=True)
+
+        self.driver.set_no_of_captures(self, number_captures)
+
+        if null_trigger:
+            self.driver.set_null_trigger(self)
+
+        # tell the device to capture all the blocks:
+        approx_time_busy = self.driver.run_block(self,
+                                                 pre_trigger_samples,
+                                                 post_trigger_samples,
+                                                 timebase_info.timebase_id,
+                                                 timebase_options.oversample,
+                                                 0)
+
+        is_ready = self.driver.is_ready(self)
+        while not is_ready:
+            time.sleep(approx_time_busy / 5)
+            is_ready = self.driver.is_ready(self)
+
+        overflow_warnings = self.driver.get_values_bulk(self,
+                                                        channels,
+                                                        post_trigger_samples,
+                                                        0,
+                                                        number_captures - 1)
+        try:
+            trigger_offsets = self.driver.get_trigger_time_offsets_bulk(self, 0, number_captures - 1)
+        except NotImplementedError:
+            trigger_offsets = None
+
+        self.driver.stop(self)
+
+        times = numpy.linspace(0.,
+                               post_trigger_samples * timebase_info.time_interval,
+                               post_trigger_samples,
+                               dtype=numpy.dtype('float32'))
+
+        voltages = {}
+
+        max_adc = self.driver.maximum_value(self)
+        for channel in channels:
+            factor = self._channel_ranges[channel] / max_adc
+            voltages[channel] = numpy.multiply(self._bulk_buffers[channel], factor, dtype=numpy.dtype('float32'))
+
+        return times, voltages, trigger_offsets, overflow_warnings
+
+    @requires_open()
+    def capture_streaming(self, sample_interval, channel_configs=(), chunk_size=65536, total_samples=None,
+                          buffer_size=None, overview_buffer_size=None):
+        """device.capture_streaming(sample_interval, channel_configs, ...)
+        A generator which captures continuously in streaming mode and yields StreamingChunk objects of chunk_size
+        samples (the last one may be shorter).
+        sample_interval: requested time between samples in seconds (the device may round it, see times.)
+        channel_configs: a collection of ChannelConfig objects. If present, will be passed to set_channels.
+        total_samples: stop after this many samples. If None, capture until the generator is closed (e.g. by
+            breaking out of the loop over it.)
+        buffer_size: size of the buffer the driver writes into per channel, chunk_size by default.
+        overview_buffer_size: samples the driver holds between reads, 4 * buffer_size by default.
+        The driver is only asked for new samples while the next chunk is being collected, so a consumer which is too
+        slow makes the driver drop samples rather than using memory without bound. overruns counts the drops which can
+        be seen from the driver's start index, a lower bound only (see StreamingChunk).
+        The arrays in a chunk are reused for the next chunk: copy them if they must be kept after the next iteration.
+        """
+        if channel_configs:
+            self.set_channels(*channel_configs)
+
+        if len(self._channel_ranges) == 0:
+            raise NoChannelsEnabledError("We cannot capture any data if no channels are enabled.")
+
+        if buffer_size is None:
+            buffer_size = chunk_size
+        if overview_buffer_size is None:
+            overview_buffer_size = 4 * buffer_size
+        channels = list(self._channel_ranges.keys())
+
+        # the driver writes into these buffers from the callback, which copies the new samples into the staging
+        # buffers (which start with room for one chunk plus one callback's worth of samples, and grow if the driver
+        # calls back more than once per get_streaming_latest_values), the chunks are scaled from there.
+        driver_buffers = {channel: numpy.zeros(buffer_size, numpy.dtype('int16')) for channel in channels}
+        staging = {channel: numpy.zeros(chunk_size + buffer_size, numpy.dtype('int16')) for channel in channels}
+        voltages = {channel: numpy.zeros(chunk_size, numpy.dtype('float32')) for channel in channels}
+        state = {'staged': 0, 'received': 0, 'next_start': None, 'overruns': 0, 'overflow': 0, 'auto_stop': False}
+
+        for channel in channels:
+            self.driver.set_data_buffer(self, channel, driver_buffers[channel])
+
+        def streaming_ready(handle, no_of_samples, start_index, overflow, trigger_at, triggered, auto_stop, param):
+            if no_of_samples > 0:
+                if state['next_start'] is not None and start_index not in (state['next_start'], 0):
+                    # the driver skipped part of its buffer (other than wrapping round to its start): samples were lost
+                    state['overruns'] += 1
+                staged = state['staged']
+                if staged + no_of_samples > len(staging[channels[0]]):
+                    size = max(2 * len(staging[channels[0]]), staged + no_of_samples)
+                    for channel in channels:
+                        grown = numpy.zeros(size, numpy.dtype('int16'))
+                        grown[:staged] = staging[channel][:staged]
+                        staging[channel] = grown
+                for channel in channels:
+                    staging[channel][staged:staged + no_of_samples] = \
+                        driver_buffers[channel][start_index:start_index + no_of_samples]
+                state['staged'] = staged + no_of_samples
+                state['received'] += no_of_samples
+                state['next_start'] = (start_index + no_of_samples) % buffer_size
+            state['overflow'] |= overflow
+            state['auto_stop'] = state['auto_stop'] or bool(auto_stop)
+
+        # keep a reference to the callback for as long as the driver may call it.
+        callback = self.driver.StreamingReadyType(streaming_ready)
+
+        max_adc = self.driver.maximum_value(self)
+        factors = {channel: self._channel_ranges[channel] / max_adc for channel in channels}
+
+        self.driver.set_null_trigger(self)
+        actual_interval = self.driver.run_streaming(self,
+                                                    sample_interval,
+                                                    0,
+                                                    total_samples if total_samples is not None else buffer_size,
+                                                    total_samples is not None,
+                                                    overview_buffer_size)
+        times = numpy.zeros(chunk_size, numpy.dtype('float64'))
+        poll_interval = min(max(actual_interval * buffer_size / 4, 1e-4), 0.01)
+        start_time = time.time()
+        start_index = 0
+        try:
+            while total_samples is None or start_index < total_samples:
+                # collect a chunk
+                while state['staged'] < chunk_size and not state['auto_stop']:
+                    if not self.driver.get_streaming_latest_values(self, callback) or state['staged'] < chunk_size:
+                        time.sleep(poll_interval)
+                n = min(chunk_size, state['staged'])
+                if total_samples is not None:
+                    n = min(n, total_samples - start_index)
+                if n == 0:
+                    break
+
+                overflow_warnings = {}
+                for channel in channels:
+                    numpy.multiply(staging[channel][:n], factors[channel], out=voltages[channel][:n])
+                    if state['overflow'] & (1 << self.driver.PICO_CHANNEL[channel]):
+                        overflow_warnings[channel] = True
+                state['overflow'] = 0
+                times[:n] = (start_index + numpy.arange(n)) * actual_interval
+
+                elapsed = time.time() - start_time
+                sample_rate = state['received'] / elapsed if elapsed > 0 else 0.
+                yield StreamingChunk(start_index,
+                                     times[:n],
+                                     {channel: voltages[channel][:n] for channel in channels},
+                                     overflow_warnings,
+                                     sample_rate,
+                                     state['overruns'])
+
+                # move the samples beyond the chunk to the front of the staging buffers
+                left = state['staged'] - n
+                for channel in channels:
+                    staging[channel][:left] = staging[channel][n:n + left]
+                state['staged'] = left
+                start_index += n
+        finally:
+            self.driver.stop(self)
@@ -19,12 +19,17 @@ import numpy
 
 from picosdk.errors import CannotFindPicoSDKError, CannotOpenPicoSDKError, DeviceNotFoundError, \
     ArgumentOutOfRangeError, ValidRangeEnumValueNotValidForThisDevice, DeviceCannotSegmentMemoryError, \
-    InvalidMemorySegmentsError, InvalidTimebaseError, InvalidTriggerParameters, InvalidCaptureParameters
+    InvalidMemorySegmentsError, InvalidTimebaseError, InvalidTriggerParameters, InvalidCaptureParameters, \
+    FeatureNotSupportedError
 
 
 from picosdk.device import Device
 
 
+# seconds per unit of the TIME_UNITS enums (FS, PS, NS, US, MS, S), the same on all drivers which stream.
+_TIME_UNITS = [1e-15, 1e-12, 1e-9, 1e-6, 1e-3, 1.]
+
+
 """TimebaseInfo: A type for holding the particulars of a timebase configuration.
 """
 TimebaseInfo = collections.namedtuple('TimebaseInfo', ['timebase_id',
@@ -47,7 +52,10 @@ def requires_device(error_message="This method requires a Device instance regist
 class Library(object):
     def __init__(self, name):
         self.name = name
-        self._clib = self._load()
+        # the shared library is loaded on first use of one of its functions (or by load()), so importing a driver
+        # module works without the SDK installed.
+        self._clib = None
+        self._symbols = {}
         # ! some drivers will replace these dicts at import time, where they have different constants (notably ps2000).
         self.PICO_INFO = constants.PICO_INFO
         self.PICO_STATUS = constants.PICO_STATUS
@@ -85,19 +93,21 @@ class Library(object):
             raise CannotOpenPicoSDKError("PicoSDK (%s) not compatible (check 32 vs 64-bit): %s" % (self.name, e))
         return result
 
+    def load(self):
+        """Loads the shared library if it is not loaded yet.
+        Raises CannotFindPicoSDKError or CannotOpenPicoSDKError if it cannot be loaded."""
+        if self._clib is None:
+            self._clib = self._load()
+        return self._clib
+
     def __str__(self):
         return "picosdk %s library" % self.name
 
     def make_symbol(self, python_name, c_name, return_type, argument_types, docstring=None):
-        """Used by python wrappers for particular drivers to register C functions on the class."""
-        c_function = getattr(self._clib, c_name)
-        c_function.restype = return_type
-        c_function.argtypes = argument_types
-        if docstring is not None:
-            c_function.__doc__ = docstring
+        """Used by python wrappers for particular drivers to register C functions on the class.
+        The C function is looked up when one of its names is first used."""
         # make the functions available under *both* their original and generic names
-        setattr(self, python_name, c_function)
-        setattr(self, c_name, c_function)
+        names = [python_name, c_name]
         # AND if the function is camel case, add an "underscore-ized" version:
         if python_name.lower() != python_name:
             acc = []
@@ -108,7 +118,30 @@ class Library(object):
                 acc.append(c)
             if acc[:2] == ['_', '_']:
                 acc = acc[1:]
-            setattr(self, "".join(acc), c_function)
+            names.append("".join(acc))
+        symbol = (c_name, return_type, argument_types, docstring, names)
+        for name in names:
+            self._symbols[name] = symbol
+        if self._clib is not None:
+            self._bind_symbol(symbol)
+
+    def _bind_symbol(self, symbol):
+        c_name, return_type, argument_types, docstring, names = symbol
+        c_function = getattr(self.load(), c_name)
+        c_function.restype = return_type
+        c_function.argtypes = argument_types
+        if docstring is not None:
+            c_function.__doc__ = docstring
+        for name in names:
+            setattr(self, name, c_function)
+
+    def __getattr__(self, name):
+        # only called for names not set yet: C functions registered with make_symbol are bound on first use
+        symbols = self.__dict__.get('_symbols', {})
+        if name not in symbols:
+            raise AttributeError("%s has no attribute %s" % (self, name))
+        self._bind_symbol(symbols[name])
+        return self.__dict__[name]
 
     def list_units(self):
         """Returns: a list of dictionaries which identify connected devices which use this driver."""
@@ -135,7 +168,10 @@ class Library(object):
         returns: a Device instance, which has functions on it for collecting data and using the waveform generator (if
             present).
         Note: Either use this object in a context manager, or manually call .close() on it when you are finished."""
-        return Device(self, self._python_open_unit(serial=serial, resolution=resolution))
+        handle = self._python_open_unit(serial=serial, resolution=resolution)
+        if resolution is None and len(self._open_unit.argtypes) == 3:
+            resolution = self.DEFAULT_RESOLUTION
+        return Device(self, handle, resolution)
 
     @requires_device("close_unit requires a picosdk.device.Device instance, passed to the correct owning driver.")
     def close_unit(self, device):
@@ -577,3 +613,158 @@ class Library(object):
             status = self._stop(c_int16(device.handle))
             if status != self.PICO_STATUS['PICO_OK']:
                 raise InvalidCaptureParameters("stop failed (%s)" % constants.pico_tag(status))
+
+    @requires_device()
+    def set_data_buffer(self, device, channel_name, buffer, segment_index=0, bulk=False):
+        """register a numpy int16 array which the driver will write the samples of a channel into (until the next
+        call for the same channel and segment). The array must stay alive, and not be reallocated, while the driver
+        uses it.
+        bulk: True for the buffers of a rapid block capture, read with get_values_bulk."""
+        if len(self._set_data_buffer.argtypes) == 6:
+            status = self._set_data_buffer(c_int16(device.handle),
+                                           c_int32(self.PICO_CHANNEL[channel_name]),
+                                           buffer.ctypes.data,
+                                           c_int32(len(buffer)),
+                                           c_uint32(segment_index),
+                                           c_int32(self.PICO_RATIO_MODE.get('NONE', 0)))
+            if status != self.PICO_STATUS['PICO_OK']:
+                raise InvalidCaptureParameters("set_data_buffer failed (%s)" % constants.pico_tag(status))
+        elif bulk and hasattr(self, '_set_data_buffer_bulk') and len(self._set_data_buffer_bulk.argtypes) == 6:
+            # ps6000: rapid block buffers, one per segment (waveform), are registered with a separate function.
+            status = self._set_data_buffer_bulk(c_int16(device.handle),
+                                                c_int32(self.PICO_CHANNEL[channel_name]),
+                                                buffer.ctypes.data,
+                                                c_uint32(len(buffer)),
+                                                c_uint32(segment_index),
+                                                c_int32(self.PICO_RATIO_MODE.get('NONE', 0)))
+            if status != self.PICO_STATUS['PICO_OK']:
+                raise InvalidCaptureParameters("set_data_buffer_bulk failed (%s)" % constants.pico_tag(status))
+        elif not bulk and segment_index == 0 and len(self._set_data_buffer.argtypes) == 5:
+            status = self._set_data_buffer(c_int16(device.handle),
+                                           c_int32(self.PICO_CHANNEL[channel_name]),
+                                           buffer.ctypes.data,
+                                           c_uint32(len(buffer)),
+                                           c_int32(self.PICO_RATIO_MODE.get('NONE', 0)))
+            if status != self.PICO_STATUS['PICO_OK']:
+                raise InvalidCaptureParameters("set_data_buffer failed (%s)" % constants.pico_tag(status))
+        else:
+            raise NotImplementedError("not done other driver types yet")
+
+    @requires_device()
+    def run_streaming(self, device, sample_interval, pre_trigger_samples, post_trigger_samples, auto_stop,
+                      overview_buffer_size):
+        """tell the device to start capturing in streaming mode now, into the buffers registered with set_data_buffer.
+        sample_interval: requested time between samples in seconds.
+        returns: the time between samples (in seconds) which the device will use."""
+        if hasattr(self, '_run_streaming') and len(self._run_streaming.argtypes) == 9:
+            # express the interval in the largest unit which holds it exactly, nanoseconds if none does.
+            units = 2
+            for i in range(len(_TIME_UNITS) - 1, -1, -1):
+                value = round(sample_interval / _TIME_UNITS[i])
+                if value >= 1 and abs(value * _TIME_UNITS[i] - sample_interval) <= 1e-9 * sample_interval:
+                    units = i
+                    break
+            interval = c_uint32(max(int(round(sample_interval / _TIME_UNITS[units])), 1))
+            status = self._run_streaming(c_int16(device.handle),
+                                         byref(interval),
+                                         c_int32(units),
+                                         c_uint32(pre_trigger_samples),
+                                         c_uint32(post_trigger_samples),
+                                         c_int16(1 if auto_stop else 0),
+                                         c_uint32(1),
+                                         c_int32(self.PICO_RATIO_MODE.get('NONE', 0)),
+                                         c_uint32(overview_buffer_size))
+            if status != self.PICO_STATUS['PICO_OK']:
+                raise InvalidCaptureParameters("run_streaming failed (%s)" % constants.pico_tag(status))
+            return interval.value * _TIME_UNITS[units]
+        else:
+            raise NotImplementedError("not done other driver types yet")
+
+    @requires_device()
+    def get_streaming_latest_values(self, device, callback):
+        """ask the driver for the samples captured since the last call, it calls callback (a StreamingReadyType) for
+        them before returning.
+        returns: False if there was nothing new (the driver was busy), True otherwise."""
+        if hasattr(self, '_get_streaming_latest_values') and len(self._get_streaming_latest_values.argtypes) == 3:
+            status = self._get_streaming_latest_values(c_int16(device.handle), callback, None)
+            if status == self.PICO_STATUS['PICO_BUSY']:
+                return False
+            if status != self.PICO_STATUS['PICO_OK']:
+                raise InvalidCaptureParameters("get_streaming_latest_values failed (%s)" % constants.pico_tag(status))
+            return True
+        else:
+            raise NotImplementedError("not done other driver types yet")
+
+    @requires_device()
+    def set_no_of_captures(self, device, number_captures):
+        """set how many captures the next run_block makes in rapid block mode, one per memory segment (see
+        memory_segments.)"""
+        if not hasattr(self, '_set_no_of_captures'):
+            raise DeviceCannotSegmentMemoryError()
+        status = self._set_no_of_captures(c_int16(device.handle), self._set_no_of_captures.argtypes[1](number_captures))
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("set_no_of_captures failed (%s)" % constants.pico_tag(status))
+
+    @requires_device()
+    def set_device_resolution(self, device, resolution):
+        """set the resolution of a flexible resolution device, a numeric constant from the relevant driver module."""
+        if hasattr(self, '_SetDeviceResolution'):
+            set_resolution = self._SetDeviceResolution
+        elif hasattr(self, '_SetResolution'):
+            set_resolution = self._SetResolution
+        else:
+            raise FeatureNotSupportedError("%s devices have a fixed resolution." % self.name)
+        status = set_resolution(c_int16(device.handle), set_resolution.argtypes[1](resolution))
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise ArgumentOutOfRangeError("set_device_resolution failed (%s)" % constants.pico_tag(status))
+
+    @requires_device()
+    def get_values_bulk(self, device, active_channels, num_samples, from_segment_index, to_segment_index):
+        """read the captures in segments from_segment_index to to_segment_index (inclusive) into the buffers
+        registered for each segment with set_data_buffer.
+        returns: a dict of channel names which went over range, to a boolean array with one value per capture."""
+        if len(self._get_values_bulk.argtypes) == 7:
+            overflow = numpy.zeros(to_segment_index - from_segment_index + 1, numpy.dtype('int16'))
+            samples_collected = c_uint32(num_samples)
+            status = self._get_values_bulk(c_int16(device.handle),
+                                           byref(samples_collected),
+                                           c_uint32(from_segment_index),
+                                           c_uint32(to_segment_index),
+                                           c_uint32(1),
+                                           c_int32(self.PICO_RATIO_MODE.get('NONE', 0)),
+                                           overflow.ctypes.data)
+            if status != self.PICO_STATUS['PICO_OK']:
+                raise InvalidCaptureParameters("get_values_bulk failed (%s)" % constants.pico_tag(status))
+        else:
+            raise NotImplementedError("not done other driver types yet")
+
+        overflow_warning = {}
+        for channel in active_channels:
+            channel_overflow = (overflow & (1 << self.PICO_CHANNEL[channel])) != 0
+            if channel_overflow.any():
+                overflow_warning[channel] = channel_overflow
+
+        return overflow_warning
+
+    @requires_device()
+    def get_trigger_time_offsets_bulk(self, device, from_segment_index, to_segment_index):
+        """get the time between the trigger point and the trigger sample of each capture in segments
+        from_segment_index to to_segment_index (inclusive).
+        returns: a numpy array of the offsets in seconds."""
+        for name in ('_get_values_trigger_time_offset_bulk64', '_get_values_trigger_time_offset_bulk'):
+            if hasattr(self, name) and len(getattr(self, name).argtypes) == 5:
+                get_offsets = getattr(self, name)
+                break
+        else:
+            raise NotImplementedError("not done other driver types yet")
+        number_captures = to_segment_index - from_segment_index + 1
+        times = numpy.zeros(number_captures, numpy.dtype('int64'))
+        time_units = numpy.zeros(number_captures, numpy.dtype('int32'))
+        status = get_offsets(c_int16(device.handle),
+                             times.ctypes.data,
+                             time_units.ctypes.data,
+                             get_offsets.argtypes[3](from_segment_index),
+                             get_offsets.argtypes[4](to_segment_index))
+        if status != self.PICO_STATUS['PICO_OK']:
+            raise InvalidCaptureParameters("get_trigger_time_offsets_bulk failed (%s)" % constants.pico_tag(status))
+        return times * numpy.array(_TIME_UNITS)[time_units]
@@ -0,0 +1,80 @@
+"""
+Unit tests for the timebase cache of picosdk.device.Device, against a fake flexible resolution driver.
+"""
+
+from __future__ import print_function
+
+import unittest
+
+from picosdk.device import Device, ChannelConfig, TimebaseOptions
+from picosdk.errors import InvalidTimebaseError
+from picosdk.library import TimebaseInfo
+
+RESOLUTION_8BIT = 0
+RESOLUTION_12BIT = 2
+
+
+class FakeFlexResDriver(object):
+    """Answers get_timebase like a ps5000a: timebase 0 (1 ns) is only available at 8 bit resolution."""
+    name = "fake"
+    MAX_MEMORY = 2**20
+    PICO_CHANNEL = {'A': 0, 'B': 1}
+
+    def __init__(self):
+        self.resolution = RESOLUTION_8BIT
+        self.calls = 0
+
+    def set_channel(self, device, channel_name, enabled, coupling=None, range_peak=None, analog_offset=None):
+        return range_peak if enabled else None
+
+    def set_device_resolution(self, device, resolution):
+        self.resolution = resolution
+
+    def get_timebase(self, device, timebase_id, no_of_samples, oversample=1, segment_index=0):
+        self.calls += 1
+        if timebase_id == 0 and self.resolution != RESOLUTION_8BIT:
+            raise InvalidTimebaseError("timebase 0 is not available at this resolution")
+        if timebase_id < 3:
+            time_interval = 2**timebase_id * 1e-9
+        else:
+            time_interval = (timebase_id - 2) * 8e-9
+        return TimebaseInfo(timebase_id, time_interval, None, self.MAX_MEMORY, segment_index)
+
+
+class TimebaseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.driver = FakeFlexResDriver()
+        self.device = Device(self.driver, 1, RESOLUTION_8BIT)
+        self.device.set_channel(ChannelConfig('A', True, 'DC', 5.))
+        self.options = TimebaseOptions(max_time_interval=4e-9)
+
+    def test_repeated_calls_use_the_cache(self):
+        first = self.device.find_timebase(self.options)
+        calls = self.driver.calls
+        self.assertEqual(first, self.device.find_timebase(self.options))
+        self.assertEqual(calls, self.driver.calls)
+
+    def test_resolution_change_searches_again(self):
+        self.assertEqual(0, self.device.find_timebase(self.options).timebase_id)
+        self.device.set_resolution(RESOLUTION_12BIT)
+        self.assertEqual(1, self.device.find_timebase(self.options).timebase_id)
+        self.device.set_resolution(RESOLUTION_8BIT)
+        self.assertEqual(0, self.device.find_timebase(self.options).timebase_id)
+
+    def test_devices_do_not_share_the_cache(self):
+        self.device.find_timebase(self.options)
+        driver = FakeFlexResDriver()
+        driver.resolution = RESOLUTION_12BIT
+        other = Device(driver, 2, RESOLUTION_12BIT)
+        other.set_channel(ChannelConfig('A', True, 'DC', 5.))
+        self.assertEqual(1, other.find_timebase(self.options).timebase_id)
+
+    def test_closing_clears_the_cache(self):
+        self.device.find_timebase(self.options)
+        self.driver.close_unit = lambda device: None
+        self.device.close()
+        self.assertEqual({}, self.device._timebase_cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,7 +18,7 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
 from PySide6.QtWidgets import (QApplication, QCheckBox, QComboBox, QGridLayout,
     QHBoxLayout, QHeaderView, QLabel, QLineEdit,
     QPushButton, QSizePolicy, QSpacerItem, QTabWidget,
-    QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget)
+    QTableView, QVBoxLayout, QWidget)
 
 class Ui_Widget(object):
     def setupUi(self, Widget):
@@ -129,7 +129,7 @@ class Ui_Widget(object):
         self.tabWidget.addTab(self.tabSignal, "")
         self.tabData = QWidget()
         self.tabData.setObjectName(u"tabData")
-        self.tableData = QTableWidget(self.tabData)
+        self.tableData = QTableView(self.tabData)
         self.tableData.setObjectName(u"tableData")
         self.tableData.setGeometry(QRect(10, 10, 571, 471))
         self.tabWidget.addTab(self.tabData, "")
@@ -2,30 +2,95 @@
 import os
 from pathlib import Path
 import sys
-from PySide2.QtWidgets import QApplication, QWidget, QVBoxLayout, QHeaderView, QTableWidgetItem, QMessageBox
-from PySide2.QtCore import QFile, Qt, Signal, Slot
+from PySide2.QtWidgets import QApplication, QWidget, QVBoxLayout, QHeaderView, QMessageBox
+from PySide2.QtCore import QFile, Qt, QTimer, QAbstractTableModel, QModelIndex, Signal, Slot
 from PySide2.QtUiTools import QUiLoader
 import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import (FigureCanvasQTAgg,NavigationToolbar2QT)
 from dwflib.DWF import DWF
-from dwflib.dataprocess import signal_process, results_cal, rhofvu
+from dwflib.dataprocess import signal_process, results_cal, rhofvu, decimate_minmax
+from dwflib.frames import FrameQueue
+from dwflib.engine import ProcessEngine
+from dwflib.table import ColumnStore
 import numpy as np
 import threading
+import multiprocessing
+import time
 import timeit
 from datetime import datetime
 
+class DataTableModel(QAbstractTableModel):
+    # Table model over a ColumnStore: rows are added in batches by append(), and with nMax set the oldest rows are
+    # removed, so the number of rows held and painted stays bounded however long the run is
+    def __init__(self, headers, formats, nMax=None, parent=None):
+        super().__init__(parent)
+        self.headers = headers
+        self.formats = formats  # functions formatting the values of each column
+        self.store = ColumnStore(headers, nMax)
+        self.nDropped = 0  # rows removed so far, for the row numbers
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            return self.formats[index.column()](self.store.value(index.row(), index.column()))
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignCenter
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.headers[section]
+        return str(self.nDropped + section + 1)
+
+    def append(self, rows):
+        rows = np.asarray(rows, dtype=float).reshape(-1, len(self.headers))
+        if self.store.nMax is not None:
+            rows = rows[-self.store.nMax:]
+            nRemove = len(self.store) + len(rows) - self.store.nMax
+            if nRemove > 0:
+                self.beginRemoveRows(QModelIndex(), 0, nRemove - 1)
+                self.store.drop(nRemove)
+                self.nDropped += nRemove
+                self.endRemoveRows()
+        if len(rows) == 0:
+            return
+        nRows = len(self.store)
+        self.beginInsertRows(QModelIndex(), nRows, nRows + len(rows) - 1)
+        self.store.append(rows)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.store.clear()
+        self.nDropped = 0
+        self.endResetModel()
+
 class Widget(QWidget):
     message = Signal(str)
     def __init__(self, parent=None):
         super().__init__(parent)
         self.ui = self.load_ui()
+        self.plotLock = threading.Lock()
+        self.plotData = None  # latest frame to plot (time, signal, temperature), None once drawn
+        self.plotBackground = None  # figure without the animated artists, for blitting
+        self.nPlotFrames = 0  # frames passed to update_plot
+        self.nPlotDrawn = 0  # frames drawn
+        self.plotstats = {'fps': 0.0, 'dropped': 0}  # refresh rate over the last second and frames not drawn
         self.line, self.axes, self.fig = self.load_chart()
         self.load_table()
         self.dwf = DWF()
-        self.timevec = []
-        self.arData = []
-        self.vch2 = []
+        self.frames = FrameQueue()  # acquired frames from thread_run to thread_record
+        self.engine = ProcessEngine(nLength=self.dwf.nRecLength)  # processes recorded frames in worker processes
         self.gain = []
         self.nAverage = []
         self.temp = []
@@ -61,7 +126,9 @@ class Widget(QWidget):
         fig, axes = plt.subplots(ncols=1)
         self.protime = np.arange(0,8129)/50
         self.prosig = 0*self.protime
-        line, = axes.plot(self.protime,self.prosig, 'b-', linewidth=1)
+        line, = axes.plot(self.protime,self.prosig, 'b-', linewidth=1, animated=True)
+        axes.title.set_animated(True)
+        self.plotText = axes.text(0.99, 0.98, '', transform=axes.transAxes, ha='right', va='top', fontsize=8, animated=True)
         axes.set_ylim([-25,25])
         axes.set_xlabel('Time,microseconds')
         axes.set_ylabel('Amplitude,volts')
@@ -72,32 +139,58 @@ class Widget(QWidget):
         layout.addWidget(canvas,Qt.AlignCenter)
         layout.addWidget(toolbar,Qt.AlignCenter)
         self.ui.tabSignal.setLayout(layout)
+        # redraw the plot at up to fpsPlot frames per second, see refresh_plot
+        canvas.mpl_connect('draw_event', self.on_draw)
+        self.fpsPlot = 20
+        self.tPlotStats = time.monotonic()
+        self.nDrawnStats = 0
+        self.plotTimer = QTimer(self)
+        self.plotTimer.setInterval(int(1000 / self.fpsPlot))
+        self.plotTimer.timeout.connect(self.refresh_plot)
+        self.plotTimer.start()
         return line, axes, fig
 
     def load_table(self):
-        self.ui.tableData.setColumnCount(4)
-        self.ui.tableData.setHorizontalHeaderLabels(["Timestamp", "Temperature", "PT1000 Voltage", "Relative Amplitude"])
+        # rows are added by update_table from the recording thread and moved to the model by flush_table in the GUI thread
+        self.nTableRows = 10000  # rows shown at most, older rows are removed from the table (not from the data files)
+        self.tableRows = []
+        self.tableClear = False
+        self.tableLock = threading.Lock()
+        self.tableModel = DataTableModel(["Timestamp", "Temperature", "PT1000 Voltage", "Relative Amplitude"],
+                                         [lambda t: datetime.fromtimestamp(t).strftime('%d-%m-%YT%H-%M-%S'),
+                                          lambda v: ("%4.3f") % v, lambda v: ("%4.5f") % v, lambda v: ("%4.3f") % v],
+                                         self.nTableRows, self)
+        self.ui.tableData.setModel(self.tableModel)
         header = self.ui.tableData.horizontalHeader()
         header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(1, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(2, QHeaderView.ResizeMode.Stretch)
         header.setSectionResizeMode(3, QHeaderView.ResizeMode.Stretch)
+        self.tableTimer = QTimer(self)
+        self.tableTimer.setInterval(250)
+        self.tableTimer.timeout.connect(self.flush_table)
+        self.tableTimer.start()
 
     def clear_table(self):
-        self.ui.tableData.clearContents()
-        self.ui.tableData.setRowCount(0)
+        with self.tableLock:
+            self.tableRows = []
+            self.tableClear = True
 
     def update_table(self,timestp,temp,pt1000,atten):
-        rowIndex = self.ui.tableData.rowCount()
-        item1 = QTableWidgetItem(timestp)
-        item2 = QTableWidgetItem(temp)
-        item3 = QTableWidgetItem(pt1000)
-        item4 = QTableWidgetItem(atten)
-        self.ui.tableData.insertRow(rowIndex)
-        itemlist = [item1,item2,item3,item4]
-        for item in itemlist:
-            item.setTextAlignment(Qt.AlignCenter)
-            self.ui.tableData.setItem(rowIndex,itemlist.index(item),item)
+        # queue a row (time.time() timestamp and values), added to the table with the others queued on the next flush_table
+        with self.tableLock:
+            self.tableRows.append((timestp,temp,pt1000,atten))
+
+    def flush_table(self):
+        with self.tableLock:
+            rows = self.tableRows
+            self.tableRows = []
+            bClear = self.tableClear
+            self.tableClear = False
+        if bClear:
+            self.tableModel.clear()
+        if rows:
+            self.tableModel.append(rows)
 
     @Slot(str)
     def showDialogWarning(self,message):
@@ -165,16 +258,61 @@ class Widget(QWidget):
         self.gain = [nRxGain1,nRxGain2,nTxGain1,nTxGain2]
 
     def update_plot(self,xdata,ydata):
-        self.line.set_xdata(xdata*1e6)
-        self.line.set_ydata(ydata)
+        # called from the acquisition thread, only keeps the frame: it is drawn by refresh_plot in the GUI thread
+        with self.plotLock:
+            self.plotData = (xdata, ydata, self.temp)
+            self.nPlotFrames += 1
+
+    def refresh_plot(self):
+        # draw the latest frame on the plot timer, frames arriving faster than the refresh rate are skipped
+        with self.plotLock:
+            data = self.plotData
+            self.plotData = None
+            nFrames = self.nPlotFrames
+
+        if data is not None:
+            [xdata, ydata, temp] = data
+            xdata = np.asarray(xdata)*1e6
+            ydata = np.asarray(ydata)
+            # only the visible part, at most two points (min/max) per pixel column
+            [xmin, xmax] = self.axes.get_xlim()
+            i0 = max(np.searchsorted(xdata, xmin) - 1, 0)
+            i1 = np.searchsorted(xdata, xmax) + 1
+            xdata, ydata = decimate_minmax(xdata[i0:i1], ydata[i0:i1], max(int(self.axes.bbox.width), 1))
+            self.line.set_data(xdata, ydata)
+            if self.bSweep:
+                self.axes.set_title(str(round(temp,3))+u'\N{DEGREE SIGN}C',fontsize = 10)
+            else:
+                self.axes.set_title('')
+            self.nPlotDrawn += 1
+
+        # achieved refresh rate and frames not drawn
+        tNow = time.monotonic()
+        if tNow - self.tPlotStats >= 1:
+            self.plotstats['fps'] = (self.nPlotDrawn - self.nDrawnStats) / (tNow - self.tPlotStats)
+            self.plotstats['dropped'] = nFrames - self.nPlotDrawn
+            self.tPlotStats = tNow
+            self.nDrawnStats = self.nPlotDrawn
+            self.plotText.set_text("%.1f fps, %d frames dropped" % (self.plotstats['fps'], self.plotstats['dropped']))
+        elif data is None:
+            return
 
-        if self.bSweep:
-            self.axes.set_title(str(round(self.temp,3))+u'\N{DEGREE SIGN}C',fontsize = 10)
-        else:
-            self.axes.set_title('')
+        canvas = self.fig.canvas
+        if self.plotBackground is None:
+            canvas.draw()
+            return
+        canvas.restore_region(self.plotBackground)
+        self.draw_animated()
+        canvas.blit(self.fig.bbox)
+
+    def on_draw(self, event):
+        # full redraw (first show, resize, zoom): keep the figure without the animated artists and draw them on top
+        self.plotBackground = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_animated()
 
-        self.fig.canvas.draw()
-        # self.fig.canvas.flush_events()
+    def draw_animated(self):
+        for artist in (self.line, self.axes.title, self.plotText):
+            self.fig.draw_artist(artist)
 
     def open_ad2(self):
         self.get_settings()
@@ -196,6 +334,9 @@ class Widget(QWidget):
         protime = []
         prosig = []
 
+        # read the temperature in the background while running
+        self.dwf.starttemp()
+
         while True:
             # if self.stop.isSet():
             #     break
@@ -205,20 +346,21 @@ class Widget(QWidget):
                     self.dwf.Filt = self.ui.checkBoxFilter.isChecked()
                     self.bSweep = self.ui.checkBoxSweep.isChecked()
                     # SNR_tick  = xb3.get()
-                    # get temperature pre-data collection
-                    temp1 = self.dwf.gettemp()
+                    # collect data, noting start and end times
+                    tStart = time.monotonic()
+                    [timevec, arData, vch2] = self.dwf.getsig2(self.nAverage)
+                    tEnd = time.monotonic()
 
-                    # collect data
-                    [self.timevec, self.arData, self.vch2] = self.dwf.getsig2(self.nAverage)
+                    # get temperature at the start and end of data collection (from the background readings) and average
+                    self.temp = (self.dwf.gettempat(tStart) + self.dwf.gettempat(tEnd)) / 2
 
-                    # get temperature post-data collection and average
-                    temp2 = self.dwf.gettemp()
-                    self.temp = (temp1 + temp2) / 2
+                    # hand the frame to the recording thread
+                    self.frames.put(timevec, arData, vch2, self.temp, self.dwf.nFreq, self.dwf.nAmplitude, self.gain)
 
                     if self.dwf.Filt:
-                        [protime,prosig] = signal_process(self.timevec,self.arData,self.dwf.Filt,False,self.dwf.nFreq)
+                        [protime,prosig] = signal_process(timevec,arData,self.dwf.Filt,False,self.dwf.nFreq)
                     else:
-                        [protime,prosig] = [self.timevec,self.arData]
+                        [protime,prosig] = [timevec,arData]
 
                     self.update_plot(protime,prosig)
 
@@ -232,15 +374,48 @@ class Widget(QWidget):
             else:
                 break
 
+    def record_results(self, done):
+        # save and show the results returned by the processing engine for recorded frames
+        for frame, (toa1, toa2, peak1, peak2, vel, atten) in done:
+            temp = frame.temp
+            vch2 = frame.vch2
+            (rhof, visc) = rhofvu(temp, self.sample)
+            # print('Temperature: '+str(temp))
+            # print('Sample: '+self.sample)
+            # print('Density: '+str(rhof)+' Viscosity: '+str(visc))
+
+            # save signal and data collected, label with sample name, frequency, voltage and gain settings.
+            # print("Saving data...")
+            self.dwf.savedata(self.sample+'_'+str(frame.nAmplitude)+'v_'+str(frame.nFreq)+'hz_'+str(frame.gain), [temp,toa1,toa2,peak1,peak2,vch2,atten,rhof,visc], frame.arData,
+                              {'nSampFreq': self.dwf.nSampFreq, 'nFreq': frame.nFreq, 'nAmplitude': frame.nAmplitude, 'gain': frame.gain,
+                               'Filt': self.dwf.Filt, 'UpSamp': self.dwf.UpSamp, 'nCycles': self.dwf.nCycles, 'tCutoff': self.dwf.tCutoff})
+
+            # print results in terminal
+            # self.dwf.printRow(temp, vch2, atten)
+            self.update_table(time.time(),temp,vch2,atten)
+
     def thread_record(self):
         count = 0
-        atten_new = 0
+        nSkipped = 0
+        seq = None
         tic = timeit.default_timer()
         self.pause = False
+        # save the data in the background
+        self.dwf.startwriter()
+        # start from the frames acquired after this point
+        self.frames.clear()
         while True:
             if self.recording:
                 self.ui.label_Status.setText("Status: Recording...")
                 try:
+                    # wait for the next frame, checking every 0.2 s if the recording was stopped
+                    frame = self.frames.get(timeout=0.2)
+                    if frame is None:
+                        continue
+                    if seq is not None:
+                        nSkipped += frame.seq - seq - 1
+                    seq = frame.seq
+
                     if self.bSweep == True & self.pause == True:
                         toc = timeit.default_timer()
                         delta_t = toc - tic
@@ -265,41 +440,11 @@ class Widget(QWidget):
                         self.createfolder = False
                         self.clear_table()
 
-                    # data processing (butterworth filter and up-sampling)
-                    temp = self.temp
-                    vch2 = self.vch2
-                    arData = self.arData
-                    timevec = self.timevec
-                    (protimevec, proData) = signal_process(timevec, arData, self.dwf.Filt, self.dwf.UpSamp, self.dwf.nFreq)
-
-                    # calculation for acoustic properties (velocity of sound and attenuation of sound)
-                    toa1, toa2, peak1, peak2, vel, atten = results_cal(protimevec, proData, self.dwf.nFreq, self.dwf.nCycles, self.dwf.tCutoff)
-                    (rhof, visc) = rhofvu(temp, self.sample)
-                    # print('Temperature: '+str(temp))
-                    # print('Sample: '+self.sample)
-                    # print('Density: '+str(rhof)+' Viscosity: '+str(visc))
-
-                    if not atten_new == atten:
-                        atten_new = atten
-                    else:
-                        continue
-
-                    # save signal and data collected, label with sample name, frequency, voltage and gain settings.
-                    # print("Saving data...")
-                    with open('Data_'+self.sample+'_'+str(self.dwf.nAmplitude)+'v_'+str(self.dwf.nFreq)+'hz_'+str(self.gain)+'.csv', 'a') as f2_append:
-                        # np.savetxt(f2_append, np.c_[temp, vch2, atten], fmt=('%.18e,%.18e,%.18e'), delimiter=',')
-                        np.savetxt(f2_append, np.c_[temp,toa1,toa2,peak1,peak2,vch2,atten,rhof,visc], fmt=('%.18e,%.18e,%.18e,%.18e,%.18e,%.18e,%.18e,%.18e,%.18e'), delimiter=',')
-                    with open('Signal_'+self.sample+'_'+str(self.dwf.nAmplitude)+'v_'+str(self.dwf.nFreq)+'hz_'+str(self.gain)+'.csv','a') as f1_append:
-                        np.savetxt(f1_append,[arData],delimiter = ',')
-
-                    # print results in terminal
-                    # self.dwf.printRow(temp, vch2, atten)
-                    now = datetime.now()  # current date and time
-                    strDate = now.strftime('%d-%m-%YT%H-%M-%S')
-                    strTemp = ("%4.3f") % temp
-                    strPt1000 = ("%4.5f") % vch2
-                    strAtten = ("%4.3f") % atten
-                    self.update_table(strDate,strTemp,strPt1000,strAtten)
+                    # data processing (butterworth filter and up-sampling) and calculation for acoustic properties in the engine,
+                    # the results are saved as they come back, in the order of the frames
+                    temp = frame.temp
+                    self.engine.submit(frame, frame.timevec, frame.arData, self.dwf.Filt, self.dwf.UpSamp, frame.nFreq, self.dwf.nCycles, self.dwf.tCutoff)
+                    self.record_results(self.engine.ready())
 
                     # define break condition if temperature sweep (e.g. temperature drops to below min of range)
                     if self.bSweep == True:
@@ -343,6 +488,16 @@ class Widget(QWidget):
             else:
                 break
 
+        # save the results of the frames still being processed and close the data files of this recording
+        try:
+            self.record_results(self.engine.drain())
+        except Exception as e:
+            print(e)
+            self.engine.discard()
+        self.dwf.closestores()
+        if nSkipped > 0:
+            print("Frames not recorded (recording fell behind): %d" % nSkipped)
+
     def run_test(self):
         # if self.stop.isSet():
         #     self.stop.clear()
@@ -410,6 +565,8 @@ class Widget(QWidget):
             self.recording = False
             if self.recordT.is_alive():
                 self.recordT.join()
+        # write what is still queued to disk
+        self.dwf.closestores()
 
     def closeEvent(self, event):
         reply = QMessageBox.question(self, 'Quit', 'Are you sure you want to quit?',
@@ -417,11 +574,17 @@ class Widget(QWidget):
         if reply == QMessageBox.Yes:
             self.stop_record()
             self.stop_test()
+            self.plotTimer.stop()
+            self.tableTimer.stop()
+            self.dwf.closetemp()
+            self.engine.close()
             event.accept()
         else:
             event.ignore()
 
 if __name__ == "__main__":
+    # needed for the processing engine's worker processes in frozen builds
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     app.setApplicationName("Waveguide Tester Qt")
     widget = Widget()